@@ -1,15 +1,19 @@
 import json
-from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
+from django.http import HttpResponse, Http404
 
-from .models import Organization, City
+from .models import get_city_by_slug
+from .snapshot import get_snapshot
+from . import facets
 
 def members(request, city):
-    city = get_object_or_404(City, slug=city)
-    orgs = Organization.objects.filter(
-        is_active=True,
-        city=city
-    ).order_by('name')
+    city = get_city_by_slug(city)
+    if city is None:
+        raise Http404
+    orgs = get_snapshot(city).orgs
+    ages = facets.parse_age_range(request.GET.get('ages'))
+    if ages is not None:
+        org_ids = set(facets.orgs_serving_ages(city, *ages))
+        orgs = [org for org in orgs if org.id in org_ids]
     return HttpResponse(json.dumps([{
         "name": org.name,
         "website": org.website
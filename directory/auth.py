@@ -0,0 +1,90 @@
+'''
+Loading of the current user's directory privileges.
+
+Whether a user is vouched for or privileged depends on their membership
+and its organization, so MembershipBackend fetches those along with the
+user, and PrivilegesMiddleware computes the resulting flags at most
+once per request.
+'''
+
+from functools import wraps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.views import redirect_to_login
+from django.utils.functional import cached_property
+
+from .models import is_user_vouched_for, is_user_privileged
+
+class MembershipBackend(ModelBackend):
+    '''
+    Like ModelBackend, but loads users along with their membership and
+    its organization in a single query.
+    '''
+
+    def get_queryset(self):
+        return get_user_model()._default_manager.select_related(
+            'membership__organization'
+        )
+
+    def authenticate(self, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        try:
+            user = self.get_queryset().get(**{
+                UserModel.USERNAME_FIELD: username
+            })
+        except UserModel.DoesNotExist:
+            # Run the password hasher anyways, so that the response time
+            # doesn't reveal whether the user exists.
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password):
+            return user
+        return None
+
+    def get_user(self, user_id):
+        try:
+            return self.get_queryset().get(pk=user_id)
+        except get_user_model().DoesNotExist:
+            return None
+
+class RequestPrivileges(object):
+    '''
+    The directory privileges of a user, computed lazily and only once.
+    '''
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def is_vouched_for(self):
+        return (self.user.is_authenticated() and
+                is_user_vouched_for(self.user))
+
+    @cached_property
+    def is_privileged(self):
+        return (self.user.is_authenticated() and
+                is_user_privileged(self.user))
+
+class PrivilegesMiddleware(object):
+    '''
+    Sets ``request.privileges`` to the RequestPrivileges of the
+    request's user. This must come after AuthenticationMiddleware.
+    '''
+
+    def process_request(self, request):
+        request.privileges = RequestPrivileges(request.user)
+
+def privileges_required(view):
+    '''
+    Like user_passes_test(is_user_privileged), but uses the privileges
+    PrivilegesMiddleware already loaded for the request.
+    '''
+
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if not request.privileges.is_privileged:
+            return redirect_to_login(request.get_full_path())
+        return view(request, *args, **kwargs)
+    return wrapped
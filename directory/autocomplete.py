@@ -0,0 +1,99 @@
+'''
+In-memory prefix indexes for the find.json autocomplete.
+'''
+
+from bisect import bisect_left
+
+from .snapshot import get_snapshot, register_index
+
+def normalize(text):
+    '''
+    >>> normalize(u'  Radio   ROOKIES ')
+    u'radio rookies'
+    '''
+
+    return u' '.join(text.lower().split())
+
+class PrefixIndex(object):
+    '''
+    Maps names to autocomplete results, allowing results to be found
+    by any prefix of any word in their name.
+
+    >>> index = PrefixIndex([(u'Radio Rookies', 'r'), (u'Rad Dads', 'd')])
+    >>> index.find(u'rad')
+    ['r', 'd']
+    >>> index.find(u'ROOK')
+    ['r']
+    >>> index.find(u'dads radio')
+    []
+    '''
+
+    def __init__(self, items):
+        entries = []
+        for i, (name, result) in enumerate(items):
+            words = normalize(name).split(u' ')
+            for start in range(len(words)):
+                entries.append((u' '.join(words[start:]), i))
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.positions = [i for _, i in entries]
+        self.results = [result for _, result in items]
+
+    def find(self, query):
+        '''
+        Returns all results whose name has a word starting with the
+        given query, in the order they were originally given.
+        '''
+
+        query = normalize(query)
+        if not query:
+            return []
+        positions = set()
+        i = bisect_left(self.keys, query)
+        while i < len(self.keys) and self.keys[i].startswith(query):
+            positions.add(self.positions[i])
+            i += 1
+        return [self.results[i] for i in sorted(positions)]
+
+def named_results(snapshot, kind):
+    '''
+    Returns a list of (name, autocomplete result) pairs for either the
+    organizations or the people in the given city snapshot.
+    '''
+
+    if kind == 'orgs':
+        return [
+            (org.name, {'value': org.name, 'url': org.get_absolute_url()})
+            for org in snapshot.orgs
+        ]
+    memberships = sorted(snapshot.memberships, key=lambda membership: (
+        membership.user.last_name,
+        membership.user.first_name
+    ))
+    return [
+        (membership.user.get_full_name(),
+         {'value': membership.user.get_full_name(),
+          'url': membership.get_absolute_url()})
+        for membership in memberships
+    ]
+
+for kind in ('orgs', 'people'):
+    register_index(('autocomplete', kind),
+                   lambda snapshot, kind=kind: PrefixIndex(
+                       named_results(snapshot, kind)
+                   ))
+
+def get_index(city, kind):
+    return get_snapshot(city).get_index(('autocomplete', kind))
+
+def find(city, query, include_people=False):
+    '''
+    Returns a list of autocomplete results for the given query, in
+    the form expected by find.json. Organizations are always listed
+    before people, and people are only included if requested.
+    '''
+
+    results = get_index(city, 'orgs').find(query)
+    if include_people:
+        results = results + get_index(city, 'people').find(query)
+    return results
@@ -0,0 +1,98 @@
+'''
+A global version number for the directory's data, kept in the
+default cache, which must be shared between worker processes.
+'''
+
+import time
+import threading
+from contextlib import contextmanager
+from django.core.cache import cache
+
+CACHE_KEY = 'directory_data_version'
+
+def get_version():
+    version = cache.get(CACHE_KEY)
+    if version is None:
+        # Start from the current time rather than zero, so that a cache
+        # that has been cleared never hands out a version that workers
+        # may have already seen.
+        cache.add(CACHE_KEY, int(time.time() * 1000), None)
+        version = cache.get(CACHE_KEY)
+    return version
+
+# The state of deferred_bumps() in each thread.
+_deferral = threading.local()
+
+def bump_version():
+    '''
+    Bumps the version, or, inside deferred_bumps(), marks it to be
+    bumped once that exits.
+    '''
+
+    if getattr(_deferral, 'depth', 0):
+        _deferral.pending = True
+        return
+    try:
+        cache.incr(CACHE_KEY)
+    except ValueError:
+        get_version()
+
+def defer_bumps():
+    _deferral.depth = getattr(_deferral, 'depth', 0) + 1
+
+def flush_bumps():
+    _deferral.depth = max(getattr(_deferral, 'depth', 0) - 1, 0)
+    if not _deferral.depth and getattr(_deferral, 'pending', False):
+        _deferral.pending = False
+        bump_version()
+
+@contextmanager
+def deferred_bumps():
+    '''
+    Defers bumps of the version until the end of the block, which must
+    enclose any transaction that changes directory data. Otherwise
+    another process could see the new version before the changes are
+    committed, and cache the old data under it until the next bump.
+    '''
+
+    defer_bumps()
+    try:
+        yield
+    finally:
+        flush_bumps()
+
+class DataVersionMiddleware(object):
+    '''
+    Defers bumps of the version until a response is ready, by which
+    point any transaction the view made changes in has been committed.
+    This should come first, so that it encloses all other middleware.
+    '''
+
+    def process_request(self, request):
+        defer_bumps()
+
+    def process_response(self, request, response):
+        flush_bumps()
+        return response
+
+class WorkerCache(object):
+    '''
+    A per-process cache of values derived from directory data, such as
+    in-memory indexes. Values are built lazily by calling the given
+    function with the key they're requested for, and are all dropped
+    whenever the data version changes.
+    '''
+
+    def __init__(self, build):
+        self.build = build
+        self.version = None
+        self.values = {}
+
+    def get(self, *key):
+        version = get_version()
+        if version != self.version:
+            self.values = {}
+            self.version = version
+        if key not in self.values:
+            self.values[key] = self.build(*key)
+        return self.values[key]
@@ -0,0 +1,169 @@
+'''
+Detection of likely duplicate organizations and people.
+
+Comparing every incoming record against every existing one would take
+quadratic time, so records are first grouped into blocks by cheap
+"blocking keys", such as adjacent words of a name or an email
+domain, and only records sharing a block are compared. Blocks that
+grow too large, e.g. for a word that most names contain, are ignored
+because they say little about whether two records are the same.
+'''
+
+import re
+from collections import namedtuple
+
+# Blocks with more records than this are skipped.
+MAX_BLOCK_SIZE = 50
+
+# The trigram similarity above which two names are considered alike.
+NAME_SIMILARITY_THRESHOLD = 0.6
+
+# Email domains shared by lots of unrelated organizations and people.
+# Imported organizations aren't given these as their email domain.
+GENERIC_DOMAINS = frozenset([
+    'gmail.com', 'yahoo.com', 'hotmail.com', 'aol.com', 'outlook.com',
+])
+
+STOPWORDS = frozenset([
+    'a', 'an', 'and', 'at', 'for', 'in', 'inc', 'of', 'on', 'the',
+])
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+OrgRecord = namedtuple('OrgRecord', 'label name email_domain')
+
+PersonRecord = namedtuple('PersonRecord', 'label first_name last_name '
+                                          'email')
+
+Duplicate = namedtuple('Duplicate', 'record other reason')
+
+def name_words(name):
+    '''
+    Returns the significant, normalized words of the given name.
+
+    >>> name_words(u"The WNYC's Radio Rookies, Inc.")
+    [u'wnyc', u'radio', u'rookies']
+    '''
+
+    words = WORD_RE.findall(re.sub(r"'s\b", '', name.lower()))
+    return [word for word in words if word not in STOPWORDS]
+
+_trigram_cache = {}
+
+def trigrams(name):
+    # The same names get compared many times over an import, so we
+    # remember their trigrams for the duration of it.
+    result = _trigram_cache.get(name)
+    if result is None:
+        padded = u' %s ' % u' '.join(name_words(name))
+        result = _trigram_cache[name] = frozenset(
+            padded[i:i + 3] for i in range(len(padded) - 2)
+        )
+    return result
+
+def name_similarity(a, b):
+    '''
+    Returns the Jaccard similarity of the trigrams of two names, from
+    0 to 1.
+
+    >>> name_similarity(u'Radio Rookies', u'radio rookies!')
+    1.0
+    >>> name_similarity(u'Radio Rookies', u'Museum of Art') < 0.1
+    True
+    '''
+
+    a, b = trigrams(a), trigrams(b)
+    if not (a and b):
+        return 0.0
+    return len(a & b) / float(len(a | b))
+
+def name_blocking_keys(name):
+    '''
+    Returns blocking keys for the given name: each pair of adjacent
+    significant words, or the only word if there's just one.
+
+    >>> name_blocking_keys(u'American Museum of Natural History')
+    [u'american museum', u'museum natural', u'natural history']
+    '''
+
+    words = name_words(name)
+    if len(words) == 1:
+        return words
+    return [u'%s %s' % pair for pair in zip(words, words[1:])]
+
+def org_blocking_keys(org):
+    for key in name_blocking_keys(org.name):
+        yield ('name', key)
+    if org.email_domain and org.email_domain not in GENERIC_DOMAINS:
+        yield ('domain', org.email_domain.lower())
+
+def compare_orgs(a, b):
+    if (a.email_domain and a.email_domain.lower() ==
+            (b.email_domain or '').lower() and
+            a.email_domain not in GENERIC_DOMAINS):
+        return 'same email domain'
+    if name_similarity(a.name, b.name) >= NAME_SIMILARITY_THRESHOLD:
+        return 'similar name'
+    return None
+
+def person_blocking_keys(person):
+    if person.email:
+        yield ('email', person.email.lower())
+    last_name = u''.join(name_words(person.last_name or u''))
+    if last_name:
+        yield ('name', last_name, (person.first_name or u'')[:1].lower())
+
+def compare_people(a, b):
+    if a.email and a.email.lower() == (b.email or '').lower():
+        return 'same email address'
+    full_name = lambda p: u'%s %s' % (p.first_name, p.last_name)
+    if name_similarity(full_name(a), full_name(b)) >= \
+            NAME_SIMILARITY_THRESHOLD:
+        return 'similar name'
+    return None
+
+def find_duplicates(incoming, existing, blocking_keys, compare):
+    '''
+    Returns a list of Duplicates for every incoming record that looks
+    like another incoming record or an existing one, as judged by the
+    given comparison function, which returns the reason two records
+    are alike, or None if they aren't.
+
+    >>> incoming = [OrgRecord(2, u'Radio Rookies NYC', ''),
+    ...             OrgRecord(3, u'Museum of Art', 'art.org')]
+    >>> existing = [OrgRecord('wnyc', u"WNYC's Radio Rookies", 'wnyc.org')]
+    >>> for dup in find_duplicates(incoming, existing,
+    ...                            org_blocking_keys, compare_orgs):
+    ...     print dup.record.label, dup.other.label, dup.reason
+    2 wnyc similar name
+    '''
+
+    _trigram_cache.clear()
+    records = list(incoming) + list(existing)
+    num_incoming = len(incoming)
+    blocks = {}
+    for i, record in enumerate(records):
+        for key in set(blocking_keys(record)):
+            blocks.setdefault(key, []).append(i)
+
+    compared = set()
+    matches = []
+    for key in sorted(blocks):
+        block = blocks[key]
+        if len(block) > MAX_BLOCK_SIZE:
+            continue
+        for n, i in enumerate(block):
+            if i >= num_incoming:
+                # Records are added in order, so the rest of the block
+                # is existing records, which we don't compare.
+                break
+            for j in block[n + 1:]:
+                if (i, j) in compared:
+                    continue
+                compared.add((i, j))
+                reason = compare(records[i], records[j])
+                if reason:
+                    matches.append((i, j, reason))
+    _trigram_cache.clear()
+    return [Duplicate(records[i], records[j], reason)
+            for i, j, reason in sorted(matches)]
@@ -0,0 +1,407 @@
+'''
+Faceted filtering of a city's organizations, through bitsets over
+its directory snapshot.
+'''
+
+import re
+import json
+import base64
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from .snapshot import get_snapshot, register_index, sort_key
+
+# Each bucket is a (key, label, minimum age, maximum age) tuple, where
+# an organization is in a bucket if its youth audience overlaps it.
+AGE_BUCKETS = (
+    ('0-5', 'Ages 0-5', 0, 5),
+    ('6-10', 'Ages 6-10', 6, 10),
+    ('11-14', 'Ages 11-14', 11, 14),
+    ('15-18', 'Ages 15-18', 15, 18),
+    ('19-', 'Ages 19 and up', 19, None),
+)
+
+AGE_RANGE_RE = re.compile(r'^\s*(\d{1,3})\s*(?:-\s*(\d{1,3})\s*)?$')
+
+FacetValue = namedtuple('FacetValue', 'key label count selected')
+
+Facet = namedtuple('Facet', 'name label values')
+
+def count_bits(bits):
+    '''
+    >>> count_bits(0b10110)
+    3
+    '''
+
+    return bin(bits).count('1')
+
+def lowest_bits(bits, n):
+    '''
+    Returns the positions of the n lowest set bits, in ascending order.
+
+    >>> lowest_bits(0b101100, 2)
+    [2, 3]
+    '''
+
+    positions = []
+    while bits and len(positions) < n:
+        low = bits & -bits
+        positions.append(low.bit_length() - 1)
+        bits ^= low
+    return positions
+
+def highest_bits(bits, n):
+    '''
+    Returns the positions of the n highest set bits, in ascending order.
+
+    >>> highest_bits(0b101100, 2)
+    [3, 5]
+    '''
+
+    positions = []
+    while bits and len(positions) < n:
+        position = bits.bit_length() - 1
+        positions.append(position)
+        bits ^= 1 << position
+    positions.reverse()
+    return positions
+
+def encode_cursor(name, org_id):
+    '''
+    Returns an opaque, URL-safe cursor for the given organization.
+
+    >>> decode_cursor(encode_cursor(u'Radio Rookies', 5))
+    (u'Radio Rookies', 5)
+    >>> print decode_cursor('bogus')
+    None
+    '''
+
+    return base64.urlsafe_b64encode(
+        json.dumps([name, org_id])
+    ).rstrip('=')
+
+def decode_cursor(cursor):
+    '''
+    Returns the (name, id) tuple of the given cursor, or None if it
+    isn't valid.
+    '''
+
+    try:
+        cursor = str(cursor)
+        name, org_id = json.loads(base64.urlsafe_b64decode(
+            cursor + '=' * (-len(cursor) % 4)
+        ))
+    except (TypeError, ValueError, UnicodeError):
+        return None
+    if not (isinstance(name, basestring) and isinstance(org_id, int)):
+        return None
+    return (name, org_id)
+
+def parse_age_range(value):
+    '''
+    Parses an age, or a range of ages, into a (minimum, maximum) tuple.
+    Returns None if the value isn't valid.
+
+    >>> parse_age_range('14'), parse_age_range('10-12')
+    ((14, 14), (10, 12))
+    >>> print parse_age_range('12-10'), parse_age_range('teens')
+    None None
+    '''
+
+    match = AGE_RANGE_RE.match(value or '')
+    if not match:
+        return None
+    min_age = int(match.group(1))
+    max_age = int(match.group(2) or min_age)
+    if max_age < min_age:
+        return None
+    return (min_age, max_age)
+
+class AgeIntervals(object):
+    '''
+    The youth audience age ranges of a list of organizations, for
+    finding the ones that overlap a range of ages without looking at
+    each organization.
+
+    The lower bounds are kept sorted, along with the bitsets of the
+    organizations whose lower bound is among the first N of them, and
+    likewise for the upper bounds. An overlap query is then a pair of
+    binary searches and a single AND.
+
+    >>> ages = AgeIntervals([(0, 5), (10, 18), (14, 14)])
+    >>> bin(ages.overlapping(14, 14)), bin(ages.overlapping(6, 9))
+    ('0b110', '0b0')
+    >>> bin(ages.overlapping(0, None))
+    '0b111'
+    '''
+
+    def __init__(self, ranges):
+        by_min = sorted((min_age, 1 << i)
+                        for i, (min_age, _) in enumerate(ranges))
+        by_max = sorted((max_age, 1 << i)
+                        for i, (_, max_age) in enumerate(ranges))
+        self.mins = [min_age for min_age, _ in by_min]
+        self.maxes = [max_age for max_age, _ in by_max]
+        # min_prefixes[n] has the bits of the orgs with the n lowest
+        # minimums, and max_suffixes[n] those of all but the n lowest
+        # maximums.
+        self.min_prefixes = [0]
+        for _, bit in by_min:
+            self.min_prefixes.append(self.min_prefixes[-1] | bit)
+        self.max_suffixes = [0]
+        for _, bit in reversed(by_max):
+            self.max_suffixes.append(self.max_suffixes[-1] | bit)
+        self.max_suffixes.reverse()
+
+    def overlapping(self, min_age, max_age):
+        '''
+        Returns the bitset of organizations that serve any age in the
+        given inclusive range. A maximum of None means there is no
+        upper bound.
+        '''
+
+        if max_age is None:
+            starts_in_range = self.min_prefixes[-1]
+        else:
+            starts_in_range = self.min_prefixes[bisect_right(self.mins,
+                                                             max_age)]
+        return starts_in_range & \
+               self.max_suffixes[bisect_left(self.maxes, min_age)]
+
+class Page(object):
+    '''
+    A page of organization ids from a FacetIndex, along with cursors
+    for the pages before and after it, if there are any.
+    '''
+
+    def __init__(self, object_list, previous_cursor=None,
+                 next_cursor=None):
+        self.object_list = object_list
+        self.previous_cursor = previous_cursor
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+class FacetIndex(object):
+    '''
+    Bitsets of organizations for every value of every facet.
+
+    The given organizations must be ordered by snapshot.sort_key(), as
+    a snapshot's are. That order defines the bit that represents each
+    organization, and cursors are located by bisecting on that key.
+    '''
+
+    FACETS = (
+        ('type', 'Membership type'),
+        ('age', 'Youth audience'),
+        ('since', 'Hive member since'),
+    )
+
+    def __init__(self, orgs, membership_types=()):
+        self.org_ids = []
+        self.names = []
+        # The sort key of each organization, for binary searches.
+        self.keys = []
+        self.positions = {}
+        self.all = 0
+        # Maps facet names to lists of (key, label, bitset) tuples.
+        bitsets = dict((name, {}) for name, _ in self.FACETS)
+        labels = dict((name, {}) for name, _ in self.FACETS)
+        for membership_type in membership_types:
+            bitsets['type'][str(membership_type.id)] = 0
+            labels['type'][str(membership_type.id)] = membership_type.name
+        for key, label, _, _ in AGE_BUCKETS:
+            labels['age'][key] = label
+
+        ranges = []
+        for i, org in enumerate(orgs):
+            bit = 1 << i
+            self.org_ids.append(org.id)
+            self.names.append(org.name)
+            self.keys.append(sort_key(org.name, org.id))
+            self.positions[org.id] = i
+            self.all |= bit
+            values = {'type': [], 'since': []}
+            for membership_type in org.membership_types.all():
+                key = str(membership_type.id)
+                labels['type'][key] = membership_type.name
+                values['type'].append(key)
+            ranges.append((org.min_youth_audience_age,
+                           org.max_youth_audience_age))
+            if org.hive_member_since:
+                key = str(org.hive_member_since.year)
+                labels['since'][key] = key
+                values['since'].append(key)
+            for name, keys in values.items():
+                for key in keys:
+                    bitsets[name][key] = bitsets[name].get(key, 0) | bit
+        self.ages = AgeIntervals(ranges)
+        for key, _, min_age, max_age in AGE_BUCKETS:
+            bitsets['age'][key] = self.ages.overlapping(min_age, max_age)
+
+        self.facets = {}
+        for name, _ in self.FACETS:
+            keys = bitsets[name].keys()
+            if name == 'age':
+                keys = [key for key, _, _, _ in AGE_BUCKETS]
+            elif name == 'since':
+                keys = sorted(keys, reverse=True)
+            else:
+                keys = sorted(keys, key=lambda key: labels[name][key])
+            self.facets[name] = [(key, labels[name][key], bitsets[name][key])
+                                 for key in keys]
+
+    def clean(self, selected):
+        '''
+        Given a dictionary mapping facet names to lists of selected
+        values, returns a copy that only contains valid values.
+        '''
+
+        cleaned = {}
+        for name, values in self.facets.items():
+            keys = set(key for key, _, _ in values)
+            chosen = [key for key in selected.get(name, ()) if key in keys]
+            if chosen:
+                cleaned[name] = chosen
+        return cleaned
+
+    def filter(self, selected, exclude=None, ages=None):
+        '''
+        Returns the bitset of organizations matching the given selection,
+        which maps facet names to lists of selected values. Values of the
+        same facet are ORed together, while different facets are ANDed.
+        A facet name to ignore may optionally be given, as may a
+        (minimum, maximum) range of ages the organizations must serve.
+        '''
+
+        bits = self.all
+        if ages is not None:
+            bits &= self.ages.overlapping(*ages)
+        for name, values in self.facets.items():
+            chosen = selected.get(name)
+            if not chosen or name == exclude:
+                continue
+            facet_bits = 0
+            for key, _, value_bits in values:
+                if key in chosen:
+                    facet_bits |= value_bits
+            bits &= facet_bits
+        return bits
+
+    def org_ids_for(self, bits):
+        '''
+        Returns the ids of the organizations in the given bitset, in
+        name order.
+        '''
+
+        return [org_id for i, org_id in enumerate(self.org_ids)
+                if bits >> i & 1]
+
+    def cursor(self, position):
+        return encode_cursor(self.names[position], self.org_ids[position])
+
+    def locate(self, cursor):
+        '''
+        Returns a tuple of the position of the organization named by the
+        given cursor and whether it's still in the index. If it isn't,
+        e.g. because it has since been renamed or deactivated, the
+        position it would have is returned instead.
+        '''
+
+        name, org_id = cursor
+        position = self.positions.get(org_id)
+        if position is not None and self.names[position] == name:
+            return (position, True)
+        return (bisect_left(self.keys, sort_key(name, org_id)), False)
+
+    def page(self, bits, per_page, after=None, before=None, offset=0):
+        '''
+        Returns a Page of the ids of at most the given number of
+        organizations in the given bitset. The page starts right after
+        the organization named by the ``after`` cursor, ends right
+        before the one named by the ``before`` cursor, or, if neither is
+        given, starts after skipping ``offset`` organizations.
+
+        Like a Paginator's last page, skipping past the end of the
+        listing returns its last page. If there's nothing left to show
+        after a cursor, e.g. because it refers to the end of a listing
+        that has since shrunk, the first page is returned instead.
+        '''
+
+        after, before = decode_cursor(after), decode_cursor(before)
+        if before is not None:
+            end, _ = self.locate(before)
+            positions = highest_bits(bits & ((1 << end) - 1), per_page)
+        else:
+            if after is not None:
+                start, found = self.locate(after)
+                if found:
+                    start += 1
+            else:
+                count = count_bits(bits)
+                if offset >= count:
+                    offset = max(count - 1, 0) // per_page * per_page
+                skipped = lowest_bits(bits, offset + 1)
+                start = skipped[offset] if len(skipped) > offset else 0
+            positions = lowest_bits(bits >> start << start, per_page)
+        if not positions:
+            positions = lowest_bits(bits, per_page)
+        if not positions:
+            return Page([])
+
+        first, last = positions[0], positions[-1]
+        return Page(
+            [self.org_ids[position] for position in positions],
+            previous_cursor=(self.cursor(first)
+                             if bits & ((1 << first) - 1) else None),
+            next_cursor=self.cursor(last) if bits >> (last + 1) else None
+        )
+
+    def describe(self, selected, ages=None):
+        '''
+        Returns a list of Facets describing every facet value, along
+        with the number of organizations that would match if it were
+        also selected. As is customary, the counts for a facet's values
+        disregard any other values selected in that same facet.
+        '''
+
+        facets = []
+        for name, label in self.FACETS:
+            bits = self.filter(selected, exclude=name, ages=ages)
+            chosen = selected.get(name, ())
+            facets.append(Facet(name, label, [
+                FacetValue(key, value_label, count_bits(bits & value_bits),
+                           key in chosen)
+                for key, value_label, value_bits in self.facets[name]
+            ]))
+        return facets
+
+def build_index(snapshot):
+    return FacetIndex(snapshot.orgs, snapshot.membership_types)
+
+register_index('facets', build_index)
+
+def get_index(city):
+    return get_snapshot(city).get_index('facets')
+
+def orgs_serving_ages(city, min_age, max_age):
+    '''
+    Returns the ids of the given city's active organizations, in name
+    order, whose youth audience includes any age in the given inclusive
+    range. A maximum of None means there is no upper bound.
+    '''
+
+    index = get_index(city)
+    return index.org_ids_for(index.ages.overlapping(min_age, max_age))
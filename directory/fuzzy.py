@@ -0,0 +1,182 @@
+'''
+Typo-tolerant matching of organization and people names, through a
+trigram index of the words in them.
+'''
+
+from .autocomplete import named_results, normalize
+from .snapshot import get_snapshot, register_index
+
+MAX_SUGGESTIONS = 5
+
+def max_distance_for(word):
+    '''
+    Returns the number of typos we'll tolerate in the given word.
+    Short words get less leeway, since nearly everything is within
+    a couple of edits of them.
+    '''
+
+    if len(word) <= 2:
+        return 0
+    if len(word) <= 4:
+        return 1
+    return 2
+
+def bounded_edit_distance(a, b, max_distance):
+    '''
+    Returns the Levenshtein distance between two strings, or None if
+    it's more than the given maximum, which is usually found out long
+    before the whole distance is computed.
+
+    >>> bounded_edit_distance(u'lehrer', u'lerher', 2)
+    2
+    >>> bounded_edit_distance(u'', u'abc', 3)
+    3
+    >>> print bounded_edit_distance(u'lehrer', u'museum', 2)
+    None
+    '''
+
+    if abs(len(a) - len(b)) > max_distance:
+        return None
+    previous = range(len(b) + 1)
+    for i, char_a in enumerate(a):
+        current = [i + 1]
+        for j, char_b in enumerate(b):
+            current.append(min(previous[j + 1] + 1,
+                               current[j] + 1,
+                               previous[j] + (char_a != char_b)))
+        if min(current) > max_distance:
+            return None
+        previous = current
+    if previous[-1] > max_distance:
+        return None
+    return previous[-1]
+
+def trigrams(word):
+    '''
+    Returns the trigrams of the given word, padded so that its first
+    and last letters are in as many trigrams as the others.
+
+    >>> trigrams(u'ab')
+    [u'$$a', u'$ab', u'ab$', u'b$$']
+    '''
+
+    padded = u'$$%s$$' % word
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+class TrigramIndex(object):
+    '''
+    A set of words, for finding words within a given edit distance of
+    a query. Each edit changes at most three of a word's trigrams, so
+    only words sharing enough trigrams with the query are compared
+    with it.
+
+    >>> index = TrigramIndex([u'radio', u'rookies', u'rodeo', u'museum'])
+    >>> sorted(index.find(u'rodio', 2))
+    [(1, u'radio'), (1, u'rodeo')]
+    >>> index.find(u'museum', 0)
+    [(0, u'museum')]
+    '''
+
+    def __init__(self, words=()):
+        self.words = []
+        self.words_by_trigram = {}
+        for word in set(words):
+            self.words.append(word)
+            for trigram in set(trigrams(word)):
+                self.words_by_trigram.setdefault(trigram, []).append(
+                    len(self.words) - 1
+                )
+
+    def find(self, word, max_distance):
+        '''
+        Returns a list of (distance, word) pairs for all words within
+        the given distance of the given word.
+        '''
+
+        query_trigrams = set(trigrams(word))
+        shared = {}
+        for trigram in query_trigrams:
+            for i in self.words_by_trigram.get(trigram, ()):
+                shared[i] = shared.get(i, 0) + 1
+        min_shared = len(query_trigrams) - 3 * max_distance
+        matches = []
+        for i, count in shared.items():
+            if count < min_shared:
+                continue
+            distance = bounded_edit_distance(word, self.words[i],
+                                             max_distance)
+            if distance is not None:
+                matches.append((distance, self.words[i]))
+        return matches
+
+class FuzzyIndex(object):
+    '''
+    Maps names to results, allowing results to be found by a
+    misspelling of the words in their name.
+
+    >>> index = FuzzyIndex([(u'Brian Lehrer', 'b'), (u'Brain Trust', 't')])
+    >>> index.find(u'brain lerher')
+    ['b']
+    >>> index.find(u'brian')
+    ['b', 't']
+    >>> index.find(u'zzzzzz')
+    []
+    '''
+
+    def __init__(self, items):
+        self.positions_by_word = {}
+        for i, (name, result) in enumerate(items):
+            for word in normalize(name).split():
+                self.positions_by_word.setdefault(word, set()).add(i)
+        self.words = TrigramIndex(self.positions_by_word)
+        self.items = items
+
+    def find(self, query, limit=MAX_SUGGESTIONS):
+        '''
+        Returns up to the given number of results whose name contains
+        a close match for every word in the query, ordered by total
+        edit distance.
+        '''
+
+        distances = None
+        for word in normalize(query).split():
+            word_distances = {}
+            for distance, match in self.words.find(word,
+                                                  max_distance_for(word)):
+                for i in self.positions_by_word[match]:
+                    if distance < word_distances.get(i, distance + 1):
+                        word_distances[i] = distance
+            if distances is None:
+                distances = word_distances
+            else:
+                distances = dict(
+                    (i, distances[i] + word_distances[i])
+                    for i in distances if i in word_distances
+                )
+            if not distances:
+                return []
+        ranked = sorted((distance, self.items[i][0].lower(), i)
+                        for i, distance in (distances or {}).items())
+        return [self.items[i][1] for _, _, i in ranked[:limit]]
+
+for kind in ('orgs', 'people'):
+    register_index(('fuzzy', kind),
+                   lambda snapshot, kind=kind: FuzzyIndex(
+                       named_results(snapshot, kind)
+                   ))
+
+def get_index(city, kind):
+    return get_snapshot(city).get_index(('fuzzy', kind))
+
+def find(city, query, include_people=False):
+    '''
+    Returns a list of autocomplete results whose names are close to
+    the given query, in the form expected by find.json. Organizations
+    are always listed before people, and people are only included if
+    requested.
+    '''
+
+    results = get_index(city, 'orgs').find(query)
+    if include_people:
+        results = results + get_index(city, 'people').find(query)
+    return results
@@ -0,0 +1,53 @@
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from directory.data_version import deferred_bumps
+from directory.models import EmailDomain, Membership, find_affiliations
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run',
+            dest='dry_run',
+            default=False,
+            help='don\'t actually affiliate anyone',
+            action='store_true'
+        ),
+    )
+
+    help = '''\
+    Affiliates every active user who doesn't belong to an organization
+    with the organization their email address belongs to, if there's
+    exactly one.
+
+    This is the same thing that happens when a user activates their
+    account, so it's only needed after organizations' email domains
+    have been added or changed.
+    '''
+
+    def handle(self, *args, **kwargs):
+        org_ids_by_domain = {}
+        for reversed_name, org_id in EmailDomain.objects.values_list(
+            'reversed_name', 'organization_id'
+        ):
+            org_ids_by_domain.setdefault(reversed_name, []).append(org_id)
+
+        memberships = Membership.objects.filter(
+            organization__isnull=True,
+            user__is_active=True
+        ).exclude(user__email='').select_related('user')
+        count = 0
+        with deferred_bumps(), transaction.atomic():
+            for membership in memberships:
+                org_ids = find_affiliations(membership.user.email,
+                                            org_ids_by_domain)
+                if len(org_ids) != 1:
+                    continue
+                count += 1
+                self.stdout.write("  Affiliating %s with organization "
+                                  "#%d" % (membership.user.email,
+                                           org_ids[0]))
+                if not kwargs['dry_run']:
+                    membership.organization_id = org_ids[0]
+                    membership.save()
+        self.stdout.write("%d user(s) affiliated." % count)
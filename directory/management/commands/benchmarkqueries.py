@@ -0,0 +1,252 @@
+import time
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.contrib.auth.models import User
+
+from directory.models import City, Organization, Membership, Expertise, \
+                             ContentChannel, ActivityEvent, \
+                             OrganizationMembershipType
+from directory.snapshot import snapshot_querysets
+from directory.views import get_recent_activity
+
+# Models whose index_together indexes are benchmarked.
+INDEXED_MODELS = (Organization, Membership, Expertise, ContentChannel,
+                  ActivityEvent)
+
+CATEGORIES = [category for category, _ in Expertise.CATEGORY_CHOICES]
+
+CHANNELS = [category for category, _ in ContentChannel.CATEGORY_CHOICES]
+
+def hot_queries(city):
+    '''
+    Returns a list of (label, queryset) pairs for the queries that our
+    busiest pages make, for the given city. Most pages are rendered
+    from the city's snapshot, so these are mostly the queries that
+    build it.
+    '''
+
+    querysets = snapshot_querysets(city)
+    org_ids = [org.id for org in querysets['orgs']]
+    return [
+        ('snapshot organizations', querysets['orgs']),
+        # This is the query prefetch_related() makes for the above.
+        ('snapshot organization membership types',
+         OrganizationMembershipType.objects.filter(orgs__in=org_ids)),
+        ('snapshot channels', querysets['channels']),
+        ('snapshot memberships', querysets['memberships']),
+        ('snapshot membership types', querysets['membership_types']),
+        ('category mentors', Expertise.objects.of_vouched_users().filter(
+            category=CATEGORIES[0]
+        ).select_related(
+            'user__membership__organization__city'
+        ).order_by('created', 'id')[:20]),
+        ('recent activity', get_recent_activity(city)),
+    ]
+
+def tagged_sql(queryset, tag):
+    '''
+    Returns the SQL and parameters of the given query, with a comment
+    containing the given tag. Python's sqlite3 module reuses prepared
+    statements with the same text, along with their plans, so each
+    pass of the benchmark needs its own statements to be planned anew.
+    '''
+
+    sql, params = queryset.query.sql_with_params()
+    return '%s /* %s */' % (sql, tag), params
+
+def explain(queryset, tag):
+    sql, params = tagged_sql(queryset, tag)
+    if connection.vendor == 'sqlite':
+        sql = 'EXPLAIN QUERY PLAN ' + sql
+    else:
+        sql = 'EXPLAIN ' + sql
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    return [u' '.join(unicode(column) for column in row)
+            for row in cursor.fetchall()]
+
+def time_query(queryset, repeat, tag):
+    '''
+    Returns the median time it takes to run the given query and fetch
+    its rows, in milliseconds.
+    '''
+
+    sql, params = tagged_sql(queryset, tag)
+    cursor = connection.cursor()
+    # The first run warms up the database's caches, so it isn't timed.
+    cursor.execute(sql, params)
+    cursor.fetchall()
+    timings = []
+    for i in range(repeat):
+        start = time.time()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        timings.append((time.time() - start) * 1000)
+    return sorted(timings)[len(timings) // 2]
+
+def drop_composite_indexes(model):
+    '''
+    Drops the given model's index_together indexes. Unlike the schema
+    editor, this never rebuilds the table, so it can be undone by
+    rolling back the transaction on every database.
+    '''
+
+    cursor = connection.cursor()
+    constraints = connection.introspection.get_constraints(
+        cursor, model._meta.db_table
+    )
+    for fields in model._meta.index_together:
+        columns = [model._meta.get_field(field).column for field in fields]
+        for name, info in constraints.items():
+            if (info['index'] and not info['unique'] and
+                    info['columns'] == columns):
+                cursor.execute('DROP INDEX %s' %
+                               connection.ops.quote_name(name))
+
+class Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--orgs',
+            dest='orgs',
+            default=2000,
+            type='int',
+            help='number of organizations to seed per city (default 2000)'
+        ),
+        make_option('--members',
+            dest='members',
+            default=20,
+            type='int',
+            help='number of members to seed per organization (default 20)'
+        ),
+        make_option('--cities',
+            dest='cities',
+            default=3,
+            type='int',
+            help='number of cities to seed (default 3)'
+        ),
+        make_option('--repeat',
+            dest='repeat',
+            default=5,
+            type='int',
+            help='number of times to run each query (default 5)'
+        ),
+        make_option('--lock-tables',
+            action='store_true',
+            dest='lock_tables',
+            default=False,
+            help='acknowledge that the directory\'s tables are locked '
+                 'while this runs'
+        ),
+    )
+
+    help = '''\
+    Seeds a large, synthetic directory and reports the query plan and
+    median latency of the directory's hot queries, both with and
+    without the composite indexes that support them.
+
+    Everything happens in a transaction that's rolled back afterwards,
+    so the database is left as it was. However, dropping the indexes
+    locks their tables until then, which on Postgres blocks even reads
+    of them, so this must not be run against a database that is in
+    use. It refuses to run unless given --lock-tables.
+    '''
+
+    def handle(self, *args, **kwargs):
+        if not kwargs['lock_tables']:
+            raise CommandError('This locks the directory\'s tables while '
+                               'it runs, blocking the site if it uses '
+                               'this database. Pass --lock-tables to run '
+                               'it anyway.')
+        try:
+            with transaction.atomic():
+                city = self.seed(kwargs['cities'], kwargs['orgs'],
+                                 kwargs['members'])
+                queries = hot_queries(city)
+                after = self.measure(queries, kwargs['repeat'],
+                                     'with indexes')
+                for model in INDEXED_MODELS:
+                    drop_composite_indexes(model)
+                before = self.measure(queries, kwargs['repeat'],
+                                      'without indexes')
+                raise Rollback()
+        except Rollback:
+            pass
+
+        for (label, _), before, after in zip(queries, before, after):
+            self.stdout.write("%s: %.2f ms without indexes, %.2f ms "
+                              "with them." % (label, before[0], after[0]))
+            for title, plan in (("Without", before[1]),
+                                ("With", after[1])):
+                self.stdout.write("  %s indexes:" % title)
+                for line in plan:
+                    self.stdout.write("    %s" % line)
+
+    def measure(self, queries, repeat, tag):
+        return [(time_query(queryset, repeat, tag), explain(queryset, tag))
+                for _, queryset in queries]
+
+    def seed(self, num_cities, num_orgs, num_members):
+        '''
+        Bulk-creates the given number of cities, each with the given
+        number of organizations, each of which has the given number of
+        members. Returns the first city.
+        '''
+
+        self.stdout.write("Seeding %d organization(s) and %d member(s)..." %
+                          (num_cities * num_orgs,
+                           num_cities * num_orgs * num_members))
+        cities = []
+        for i in range(num_cities):
+            city = City(name='Benchmark City %d' % i,
+                        slug='benchmark-city-%d' % i)
+            city.save()
+            cities.append(city)
+            Organization.objects.bulk_create([
+                Organization(city=city, name='Organization %d-%d' % (i, j),
+                             slug='benchmark-org-%d-%d' % (i, j),
+                             website='http://example.org/',
+                             is_active=j % 10 != 0)
+                for j in range(num_orgs)
+            ])
+        orgs = Organization.objects.filter(city__in=cities)
+
+        users = []
+        for org in orgs:
+            for k in range(num_members):
+                users.append(User(username='benchmark-%d-%d' % (org.id, k),
+                                  last_name='Member %d' % k,
+                                  is_active=k % 7 != 0))
+        User.objects.bulk_create(users)
+        users = User.objects.filter(username__startswith='benchmark-') \
+                            .values_list('id', 'username')
+
+        memberships = []
+        expertises = []
+        for user_id, username in users:
+            org_id = int(username.split('-')[1])
+            memberships.append(Membership(user_id=user_id,
+                                          organization_id=org_id,
+                                          is_listed=user_id % 5 != 0))
+            expertises.append(Expertise(
+                user_id=user_id,
+                category=CATEGORIES[user_id % len(CATEGORIES)],
+                details='Benchmarking'
+            ))
+        Membership.objects.bulk_create(memberships)
+        Expertise.objects.bulk_create(expertises)
+
+        channels = []
+        events = []
+        for org in orgs:
+            for category in CHANNELS[:org.id % len(CHANNELS)]:
+                channels.append(ContentChannel(organization=org,
+                                               category=category,
+                                               url='http://example.org/'))
+            events.append(ActivityEvent(city_id=org.city_id, kind='org_added',
+                                        organization=org))
+        ContentChannel.objects.bulk_create(channels)
+        ActivityEvent.objects.bulk_create(events)
+        return cities[0]
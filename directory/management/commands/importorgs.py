@@ -1,6 +1,7 @@
 import sys
 import csv
 import datetime
+import StringIO
 from optparse import make_option
 from django.contrib.auth.models import User
 from django.core.management.base import BaseCommand, CommandError
@@ -11,7 +12,9 @@ from django.utils.text import slugify
 from directory.models import Organization, ContentChannel, \
                              ImportedUserInfo, City, MembershipRole, \
                              OrganizationMembershipType
+from directory.data_version import deferred_bumps
 from directory.phonenumber import is_phone_number
+from directory import dedupe
 
 MONTHS = ['january', 'february', 'march', 'april', 'may', 'june',
           'july', 'august', 'september', 'october', 'november', 'december']
@@ -20,7 +23,6 @@ CONTACT_FIELDS = ['contact-1', 'contact-2', 'contact-3',
                   'other-contacts']
 CONTENT_CHANNEL_FIELDS = ['facebook', 'blog', 'youtube',
                           'flickr', 'other-social-content-channels']
-NON_ORG_DOMAINS = ['gmail.com']
 
 class DryRunFinished(Exception):
     pass
@@ -147,6 +149,25 @@ def normalize_url(url):
         return url
     return 'http://%s' % url
 
+def get_email_domain(contacts):
+    '''
+    Returns the email domain of the first of the given contacts, or an
+    empty string if there are none or it's a domain like gmail.com
+    that says nothing about their organization.
+
+    >>> get_email_domain([{'email': 'foo@amnh.org'}])
+    'amnh.org'
+    >>> get_email_domain([{'email': 'foo@gmail.com'}])
+    ''
+    '''
+
+    if not contacts:
+        return ''
+    email_domain = contacts[0]['email'].split('@')[1]
+    if email_domain in dedupe.GENERIC_DOMAINS:
+        return ''
+    return email_domain
+
 def convert_rows_to_dicts(rows):
     column_names = None
     dicts = []
@@ -191,26 +212,79 @@ class ImportOrgsCommand(BaseCommand):
         if self.verbosity >= 2:
             self.stdout.write(msg)
 
+    def find_duplicates(self, orginfos):
+        '''
+        Returns a list of dedupe.Duplicates for the organizations and
+        contacts in the given rows that look like each other or like
+        ones already in the database.
+        '''
+
+        orgs = []
+        people = []
+        for info in orginfos:
+            label = 'row %d (%s)' % (info['row'],
+                                     info['name-of-organization'])
+            contacts = []
+            try:
+                for field in CONTACT_FIELDS:
+                    # Any warnings will be logged when the row is
+                    # imported.
+                    contacts.extend(parse_contacts(info[field],
+                                                   StringIO.StringIO()))
+            except Exception:
+                # So will any errors, so we just skip the row here.
+                continue
+            orgs.append(dedupe.OrgRecord(label,
+                                         info['name-of-organization'],
+                                         get_email_domain(contacts)))
+            for contact in contacts:
+                people.append(dedupe.PersonRecord(
+                    '%s in %s' % (contact['full_name'].strip(), label),
+                    contact['first_name'],
+                    contact['last_name'],
+                    contact['email']
+                ))
+
+        existing_orgs = [
+            dedupe.OrgRecord('organization "%s"' % name, name, email_domain)
+            for name, email_domain in Organization.objects.filter(
+                city=self.city
+            ).values_list('name', 'email_domain')
+        ]
+        existing_people = [
+            dedupe.PersonRecord('user "%s"' % username, first_name,
+                                last_name, email)
+            for username, first_name, last_name, email in
+            User.objects.values_list('username', 'first_name',
+                                     'last_name', 'email')
+        ]
+        return (dedupe.find_duplicates(orgs, existing_orgs,
+                                       dedupe.org_blocking_keys,
+                                       dedupe.compare_orgs) +
+                dedupe.find_duplicates(people, existing_people,
+                                       dedupe.person_blocking_keys,
+                                       dedupe.compare_people))
+
     def import_rows(self, rows):
         total_membership_roles = 0
         total_twitterers = 0
         total_phone_numbers = 0
         total_contacts = 0
         orginfos = convert_rows_to_dicts(rows)
+        for dup in self.find_duplicates(orginfos):
+            self.stderr.write('WARNING: %s may be a duplicate of %s '
+                              '(%s)' % (dup.record.label, dup.other.label,
+                                        dup.reason))
         for info in orginfos:
             orgname = unicode(info['name-of-organization'])
             self.log('Importing %s...' % orgname)
             try:
                 contacts = []
-                email_domain = ''
                 for field in CONTACT_FIELDS:
                     contacts.extend(parse_contacts(info[field], self.stderr))
 
                 total_contacts += len(contacts)
-                if contacts:
-                    email_domain = contacts[0]['email'].split('@')[1]
-                    if email_domain in NON_ORG_DOMAINS:
-                        email_domain = ''
+                email_domain = get_email_domain(contacts)
 
                 if email_domain:
                     self.debug("  Email domain is %s." % email_domain)
@@ -335,7 +409,7 @@ class ImportOrgsCommand(BaseCommand):
         rows = self.get_rows(*args, **options)
 
         try:
-            with transaction.atomic():
+            with deferred_bumps(), transaction.atomic():
                 self.import_rows(rows)
                 if options['dry_run']: raise DryRunFinished()
         except DryRunFinished:
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from directory.models import Membership
+
+class Command(BaseCommand):
+    help = '''\
+    Recomputes the Gravatar hashes of members whose stored hash
+    doesn't match their email address.
+
+    Hashes are normally kept up-to-date automatically, so this is only
+    needed if memberships or users were changed without going through
+    the Django ORM, or were loaded with "manage.py loaddata".
+    '''
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            updated = Membership.objects.all().update_email_hashes()
+        self.stdout.write("Updated %d email hash(es)." % updated)
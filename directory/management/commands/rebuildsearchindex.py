@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from directory.search import rebuild_index
+
+class Command(BaseCommand):
+    help = '''\
+    Rebuilds the directory's search index from scratch.
+
+    The index is normally kept up-to-date automatically, so this is
+    only needed if directory data was changed without going through
+    the Django ORM.
+    '''
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            rebuild_index()
+        self.stdout.write("Search index rebuilt.")
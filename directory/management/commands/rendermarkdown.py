@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from directory.models import Organization, Membership
+from directory import markup
+
+class Command(BaseCommand):
+    help = '''\
+    Re-renders the stored HTML of organization missions and member
+    bios that were rendered from different text or with a different
+    renderer configuration.
+
+    This is only needed after changing the markdown renderer or its
+    sanitizer configuration, e.g. by upgrading Markdown or bleach.
+    '''
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write("Renderer version is %s." % markup.VERSION)
+        with transaction.atomic():
+            orgs = markup.update_all(Organization, 'mission')
+            memberships = markup.update_all(Membership, 'bio')
+        self.stdout.write("Re-rendered %d mission(s) and %d bio(s)." % (
+            orgs,
+            memberships
+        ))
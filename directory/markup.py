@@ -0,0 +1,104 @@
+'''
+Rendering of user-supplied markdown, such as organization missions and
+member bios, as sanitized HTML.
+
+Rendering is expensive, so models store the HTML alongside the source
+text, along with a key identifying both the source and the renderer
+configuration it was rendered with. The HTML is re-rendered whenever
+the model is saved with a different key; changing anything in this
+module's configuration changes every key, after which the
+``rendermarkdown`` management command can be used to re-render
+existing rows.
+'''
+
+import hashlib
+import markdown
+import bleach
+from django.utils.safestring import mark_safe
+
+# Bump this whenever rendering changes in a way not captured below.
+REVISION = 1
+
+ALLOWED_TAGS = bleach.ALLOWED_TAGS + [
+    'p',
+    'pre',
+    'img'
+]
+
+ALLOWED_ATTRIBUTES = bleach.ALLOWED_ATTRIBUTES.copy()
+
+ALLOWED_ATTRIBUTES.update(**{
+    'img': ['src', 'alt']
+})
+
+VERSION = hashlib.sha1(repr((
+    REVISION,
+    markdown.version,
+    bleach.__version__,
+    sorted(ALLOWED_TAGS),
+    sorted(ALLOWED_ATTRIBUTES.items()),
+))).hexdigest()
+
+def render(text):
+    '''
+    Render the given markdown/HTML text as sanitized HTML.
+
+    >>> print render(u'*hi* <script>there</script>')
+    <p><em>hi</em> &lt;script&gt;there&lt;/script&gt;</p>
+    '''
+
+    return mark_safe(bleach.clean(
+        text=markdown.markdown(text),
+        tags=ALLOWED_TAGS,
+        attributes=ALLOWED_ATTRIBUTES
+    ))
+
+def get_key(text):
+    '''
+    Returns the key identifying the HTML that the given text renders
+    to with the current configuration.
+    '''
+
+    return hashlib.sha1(VERSION + text.encode('utf-8')).hexdigest()
+
+def update(obj, field):
+    '''
+    Re-renders the stored HTML for the given text field of the given
+    model instance, if it's out of date. Returns whether it was.
+    '''
+
+    key = get_key(getattr(obj, field))
+    if getattr(obj, field + '_html_key') == key:
+        return False
+    setattr(obj, field + '_html', render(getattr(obj, field)))
+    setattr(obj, field + '_html_key', key)
+    return True
+
+def get_html(obj, field):
+    '''
+    Returns the rendered HTML for the given text field of the given
+    model instance, only rendering it if the stored HTML is out of date.
+    '''
+
+    text = getattr(obj, field)
+    if getattr(obj, field + '_html_key') == get_key(text):
+        return mark_safe(getattr(obj, field + '_html'))
+    return render(text)
+
+def update_all(model, field):
+    '''
+    Re-renders the stored HTML for the given text field of every
+    instance of the given model whose HTML is out of date, without
+    otherwise saving them. Returns the number of instances updated.
+    '''
+
+    count = 0
+    html_field, key_field = field + '_html', field + '_html_key'
+    for obj in model.objects.only('id', field, key_field).iterator():
+        if update(obj, field):
+            model.objects.filter(pk=obj.pk).update(**{
+                html_field: getattr(obj, html_field),
+                key_field: getattr(obj, key_field)
+            })
+            count += 1
+    return count
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+def build_search_index(apps, schema_editor):
+    from directory.search import organization_entries, membership_entries
+
+    SearchEntry = apps.get_model('directory', 'SearchEntry')
+    Organization = apps.get_model('directory', 'Organization')
+    Membership = apps.get_model('directory', 'Membership')
+    for org in Organization.objects.filter(is_active=True):
+        SearchEntry.objects.bulk_create(
+            organization_entries(org, model=SearchEntry)
+        )
+    for membership in Membership.objects.filter(
+            organization__isnull=False).select_related('user',
+                                                       'organization'):
+        SearchEntry.objects.bulk_create(
+            membership_entries(membership, model=SearchEntry)
+        )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('directory', '0002_city_hive_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('token', models.CharField(max_length=50)),
+                ('weight', models.SmallIntegerField()),
+                ('city', models.ForeignKey(related_name='+', to='directory.City')),
+                ('membership', models.ForeignKey(related_name='+', to='directory.Membership', null=True)),
+                ('organization', models.ForeignKey(related_name='+', to='directory.Organization', null=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterIndexTogether(
+            name='searchentry',
+            index_together=set([('city', 'token')]),
+        ),
+        migrations.RunPython(build_search_index),
+    ]
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+FTS_COLUMNS = ('name', 'title', 'labels', 'text')
+
+SQLITE_FTS_TRIGGERS = {
+    'ai': 'AFTER INSERT ON directory_searchdocument BEGIN {insert} END',
+    'ad': 'AFTER DELETE ON directory_searchdocument BEGIN {delete} END',
+    'au': 'AFTER UPDATE ON directory_searchdocument BEGIN '
+          '{delete} {insert} END',
+}
+
+def create_native_search_index(apps, schema_editor):
+    from directory.search_backends import SqliteSearchBackend, \
+                                          PostgresSearchBackend
+
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX directory_searchdocument_tsvector '
+            'ON directory_searchdocument USING GIN ((%s))' %
+            PostgresSearchBackend.TSVECTOR
+        )
+    elif (connection.vendor == 'sqlite' and
+          SqliteSearchBackend.is_fts5_supported(connection)):
+        # Note that SQLite drops these triggers whenever Django rebuilds
+        # the directory_searchdocument table, so any future migration
+        # that alters SearchDocument will need to recreate them.
+        fts = SqliteSearchBackend.FTS_TABLE
+        columns = ', '.join(FTS_COLUMNS)
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE %s USING fts5(%s, "
+            "content='directory_searchdocument', content_rowid='id')" % (
+                fts, columns
+            )
+        )
+        statements = {
+            'insert': 'INSERT INTO %s(rowid, %s) VALUES (new.id, %s);' % (
+                fts, columns, ', '.join('new.' + c for c in FTS_COLUMNS)
+            ),
+            'delete': "INSERT INTO %s(%s, rowid, %s) "
+                      "VALUES ('delete', old.id, %s);" % (
+                fts, fts, columns, ', '.join('old.' + c for c in FTS_COLUMNS)
+            ),
+        }
+        for suffix, trigger in SQLITE_FTS_TRIGGERS.items():
+            schema_editor.execute('CREATE TRIGGER %s_%s %s' % (
+                fts, suffix, trigger.format(**statements)
+            ))
+
+def drop_native_search_index(apps, schema_editor):
+    from directory.search_backends import SqliteSearchBackend
+
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS '
+                              'directory_searchdocument_tsvector')
+    elif connection.vendor == 'sqlite':
+        fts = SqliteSearchBackend.FTS_TABLE
+        for suffix in SQLITE_FTS_TRIGGERS:
+            schema_editor.execute('DROP TRIGGER IF EXISTS %s_%s' % (
+                fts, suffix
+            ))
+        schema_editor.execute('DROP TABLE IF EXISTS %s' % fts)
+
+def build_search_documents(apps, schema_editor):
+    from directory.search import organization_documents, \
+                                 membership_documents
+
+    SearchDocument = apps.get_model('directory', 'SearchDocument')
+    Organization = apps.get_model('directory', 'Organization')
+    Membership = apps.get_model('directory', 'Membership')
+    for org in Organization.objects.filter(is_active=True):
+        SearchDocument.objects.bulk_create(
+            organization_documents(org, model=SearchDocument)
+        )
+    for membership in Membership.objects.filter(
+            organization__isnull=False).select_related('user',
+                                                       'organization'):
+        SearchDocument.objects.bulk_create(
+            membership_documents(membership, model=SearchDocument)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('directory', '0003_searchentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.TextField()),
+                ('title', models.TextField()),
+                ('labels', models.TextField()),
+                ('text', models.TextField()),
+                ('city', models.ForeignKey(related_name='+', to='directory.City')),
+                ('membership', models.OneToOneField(related_name='+', null=True, to='directory.Membership')),
+                ('organization', models.OneToOneField(related_name='+', null=True, to='directory.Organization')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.RunPython(create_native_search_index,
+                             drop_native_search_index),
+        migrations.RunPython(build_search_documents),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+def build_email_domains(apps, schema_editor):
+    from directory.models import reverse_domain
+
+    EmailDomain = apps.get_model('directory', 'EmailDomain')
+    Organization = apps.get_model('directory', 'Organization')
+    EmailDomain.objects.bulk_create([
+        EmailDomain(organization_id=org_id,
+                    reversed_name=reverse_domain(email_domain))
+        for org_id, email_domain in Organization.objects.exclude(
+            email_domain=''
+        ).values_list('id', 'email_domain')
+    ])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('directory', '0004_searchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailDomain',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('reversed_name', models.CharField(max_length=50, db_index=True)),
+                ('organization', models.OneToOneField(related_name='+', to='directory.Organization')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.RunPython(build_email_domains),
+    ]
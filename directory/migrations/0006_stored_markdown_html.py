@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+def render_markdown(apps, schema_editor):
+    from directory.markup import update_all
+
+    update_all(apps.get_model('directory', 'Organization'), 'mission')
+    update_all(apps.get_model('directory', 'Membership'), 'bio')
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('directory', '0005_emaildomain'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='membership',
+            name='bio_html',
+            field=models.TextField(editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='membership',
+            name='bio_html_key',
+            field=models.CharField(max_length=40, editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='organization',
+            name='mission_html',
+            field=models.TextField(editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='organization',
+            name='mission_html_key',
+            field=models.CharField(max_length=40, editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(render_markdown),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+def backfill_email_hashes(apps, schema_editor):
+    Membership = apps.get_model('directory', 'Membership')
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'UPDATE directory_membership SET email_hash = '
+            'md5(lower(trim(auth_user.email))) FROM auth_user '
+            'WHERE auth_user.id = directory_membership.user_id'
+        )
+        return
+
+    from directory.models import get_email_hash
+
+    memberships = Membership.objects.values_list('id', 'user__email')
+    for membership_id, email in memberships.iterator():
+        Membership.objects.filter(id=membership_id).update(
+            email_hash=get_email_hash(email)
+        )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('directory', '0006_stored_markdown_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='membership',
+            name='email_hash',
+            field=models.CharField(help_text=b"The Gravatar hash of the person's email address. This is kept up-to-date automatically.", max_length=32, editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(backfill_email_hashes),
+    ]
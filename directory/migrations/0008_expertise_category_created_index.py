@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('directory', '0007_membership_email_hash'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='expertise',
+            index_together=set([('category', 'created')]),
+        ),
+    ]
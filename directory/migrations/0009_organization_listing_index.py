@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('directory', '0008_expertise_category_created_index'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='organization',
+            index_together=set([('city', 'is_active', 'name')]),
+        ),
+    ]
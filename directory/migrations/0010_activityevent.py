@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+# The number of recent profile edits to carry over from each city.
+BACKFILL_EVENTS_PER_CITY = 20
+
+def backfill_profile_edits(apps, schema_editor):
+    City = apps.get_model('directory', 'City')
+    Membership = apps.get_model('directory', 'Membership')
+    ActivityEvent = apps.get_model('directory', 'ActivityEvent')
+    for city in City.objects.all():
+        memberships = Membership.objects.filter(
+            organization__city=city
+        ).order_by('-modified')[:BACKFILL_EVENTS_PER_CITY]
+        for membership in reversed(memberships):
+            event = ActivityEvent.objects.create(
+                city=city,
+                kind='profile_edited',
+                organization_id=membership.organization_id,
+                user_id=membership.user_id
+            )
+            # The creation time is set automatically on save.
+            ActivityEvent.objects.filter(id=event.id).update(
+                created=membership.modified
+            )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('directory', '0009_organization_listing_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityEvent',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('kind', models.CharField(max_length=25, choices=[(b'member_joined', b'joined'), (b'profile_edited', b'updated their profile'), (b'org_added', b'was added to the directory'), (b'org_edited', b'was updated'), (b'channel_changed', b'updated its channels')])),
+                ('city', models.ForeignKey(related_name='+', to='directory.City')),
+                ('organization', models.ForeignKey(related_name='+', to='directory.Organization', null=True)),
+                ('user', models.ForeignKey(related_name='+', to=settings.AUTH_USER_MODEL, null=True)),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterIndexTogether(
+            name='activityevent',
+            index_together=set([('city', 'created')]),
+        ),
+        migrations.RunPython(backfill_profile_edits),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('directory', '0010_activityevent'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='membership',
+            index_together=set([('organization', 'is_listed')]),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('directory', '0011_membership_listing_index'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='contentchannel',
+            index_together=set([('organization', 'category', 'modified')]),
+        ),
+    ]
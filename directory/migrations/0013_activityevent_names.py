@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+import django.db.models.deletion
+
+def store_names(apps, schema_editor):
+    ActivityEvent = apps.get_model('directory', 'ActivityEvent')
+    events = ActivityEvent.objects.values_list('id', 'organization__name',
+                                               'user__username')
+    for event_id, organization_name, username in events.iterator():
+        ActivityEvent.objects.filter(id=event_id).update(
+            organization_name=organization_name or '',
+            username=username or ''
+        )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('directory', '0012_contentchannel_category_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activityevent',
+            name='organization_name',
+            field=models.CharField(default='', max_length=100, blank=True),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='activityevent',
+            name='username',
+            field=models.CharField(default='', max_length=30, blank=True),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='activityevent',
+            name='organization',
+            field=models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, to='directory.Organization', null=True),
+        ),
+        migrations.AlterField(
+            model_name='activityevent',
+            name='user',
+            field=models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, null=True),
+        ),
+        migrations.RunPython(store_names),
+    ]
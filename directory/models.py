@@ -1,3 +1,5 @@
+import hashlib
+from collections import OrderedDict
 from django.db import models
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
@@ -8,6 +10,8 @@ from django.contrib.auth.models import User
 
 from .twitter import TwitterNameField
 from .phonenumber import PhoneNumberField
+from .data_version import WorkerCache
+from . import markup
 
 def is_user_vouched_for(user, organization=None):
     '''
@@ -30,22 +34,136 @@ def is_user_privileged(user):
 
     return is_user_vouched_for(user) or (user.is_active and user.is_staff)
 
+def get_email_hash(email):
+    '''
+    Returns the trimmed and lowercased MD5 hash of the given email
+    address, as used in Gravatar URLs.
+    '''
+
+    return hashlib.md5(email.lower().strip().encode('utf-8')).hexdigest()
+
+def reverse_domain(domain):
+    '''
+    Normalizes the given domain name and reverses the order of its
+    labels, so that subdomains share a prefix with their parents.
+
+    >>> print reverse_domain(u'Dept.Example.EDU.')
+    edu.example.dept
+    '''
+
+    labels = domain.strip().strip('.').lower().split('.')
+    return '.'.join(reversed(labels))
+
+def email_domain_suffixes(email):
+    '''
+    Returns the reversed names of every domain that the given email
+    address's domain is part of, from most to least specific. Top-level
+    domains are excluded.
+
+    >>> email_domain_suffixes(u'foo@dept.example.edu')
+    [u'edu.example.dept', u'edu.example']
+    >>> email_domain_suffixes(u'foo')
+    []
+    '''
+
+    if not (email and '@' in email):
+        return []
+    labels = reverse_domain(email.split('@')[-1]).split('.')
+    return ['.'.join(labels[:i]) for i in range(len(labels), 1, -1)]
+
+def find_affiliations(email, org_ids_by_domain):
+    '''
+    Given an email address and a dictionary mapping reversed domain
+    names to lists of organization ids, returns the ids of the
+    organizations with the most specific domain matching the address.
+
+    >>> domains = {u'edu.example': [1], u'edu.example.dept': [2]}
+    >>> find_affiliations(u'a@dept.example.edu', domains)
+    [2]
+    >>> find_affiliations(u'a@lab.example.edu', domains)
+    [1]
+    >>> find_affiliations(u'a@example.org', domains)
+    []
+    '''
+
+    for suffix in email_domain_suffixes(email):
+        if suffix in org_ids_by_domain:
+            return org_ids_by_domain[suffix]
+    return []
+
+def get_city_for_site(site_id):
+    return City.objects.filter(site=site_id).first()
+
+# Maps site ids to their cities, in each worker's memory.
+site_cities = WorkerCache(get_city_for_site)
+
+def get_cities_by_slug():
+    return dict((city.slug, city) for city in City.objects.all())
+
+# Maps city slugs to cities, in each worker's memory.
+cities_by_slug = WorkerCache(get_cities_by_slug)
+
+def get_city_by_slug(slug):
+    '''
+    Returns the City with the given slug, or None if there isn't one.
+    '''
+
+    return cities_by_slug.get().get(slug)
+
 def get_current_city(request=None):
     '''
     Returns the City for the current Site. If the current Site is
     multi-city, then None is returned.
+
+    The city is remembered on the request, if one is given.
     '''
 
-    try:
-        return get_current_site(request).city
-    except City.DoesNotExist:
-        return None
+    if request is not None and hasattr(request, '_current_city'):
+        return request._current_city
+    city = site_cities.get(get_current_site(request).id)
+    if request is not None:
+        request._current_city = city
+    return city
+
+class CityManager(models.Manager):
+    def with_directory_counts(self):
+        '''
+        Returns all cities, each annotated with its number of active
+        organizations as ``num_orgs`` and its number of listed, active
+        members of active organizations as ``num_members``, using a
+        single query.
+        '''
+
+        city = self.model._meta.db_table
+        org = Organization._meta.db_table
+        membership = Membership._meta.db_table
+        user = User._meta.db_table
+        # These are correlated subqueries rather than annotations, as
+        # Django can't filter what an annotation counts, and joining
+        # both organizations and memberships would multiply the counts.
+        return self.extra(select=OrderedDict([
+            ('num_orgs', '''SELECT COUNT(*) FROM {org}
+                WHERE {org}.city_id = {city}.id
+                AND {org}.is_active = %s'''.format(org=org, city=city)),
+            ('num_members', '''SELECT COUNT(*) FROM {membership}
+                INNER JOIN {org}
+                ON {org}.id = {membership}.organization_id
+                INNER JOIN {user} ON {user}.id = {membership}.user_id
+                WHERE {org}.city_id = {city}.id
+                AND {org}.is_active = %s
+                AND {membership}.is_listed = %s
+                AND {user}.is_active = %s'''.format(
+                    org=org, city=city, membership=membership, user=user
+                )),
+        ]), select_params=(True, True, True, True))
 
 class City(models.Model):
     '''
     Represents a city that a Hive network exists in.
     '''
 
+    objects = CityManager()
+
     multi_city_editor_permissions = ('add', 'change')
 
     HIVE_TYPE_CHOICES = (
@@ -152,10 +270,20 @@ class OrganizationManager(models.Manager):
         return self.filter(is_active=True)
 
     def possible_affiliations_for(self, user):
-        if not (user.is_active and user.email and '@' in user.email):
+        if not user.is_active:
             return self.none()
-        domain_name = user.email.split('@')[1]
-        return self.filter(email_domain=domain_name)
+        suffixes = email_domain_suffixes(user.email)
+        if not suffixes:
+            return self.none()
+        org_ids_by_domain = {}
+        for reversed_name, org_id in EmailDomain.objects.filter(
+            reversed_name__in=suffixes
+        ).values_list('reversed_name', 'organization_id'):
+            org_ids_by_domain.setdefault(reversed_name, []).append(org_id)
+        org_ids = find_affiliations(user.email, org_ids_by_domain)
+        if not org_ids:
+            return self.none()
+        return self.filter(id__in=org_ids)
 
 class Organization(models.Model):
     '''
@@ -164,6 +292,17 @@ class Organization(models.Model):
 
     city_editor_permissions = ('add', 'change')
 
+    # The number of members shown along with the organization in
+    # directory listings.
+    MEMBERSHIP_DIRECTORY_PREVIEW = 10
+
+    # Fields shown in the directory, changes to which are recorded as
+    # organization edits by directory.signals.
+    PROFILE_FIELDS = ('name', 'slug', 'website', 'address', 'twitter_name',
+                      'hive_member_since', 'mission',
+                      'min_youth_audience_age', 'max_youth_audience_age',
+                      'is_active')
+
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
     city = models.ForeignKey(
@@ -208,6 +347,9 @@ class Organization(models.Model):
                   "and basic HTML tags are allowed.",
         blank=True,
     )
+    mission_html = models.TextField(blank=True, editable=False)
+    mission_html_key = models.CharField(max_length=40, blank=True,
+                                        editable=False)
     min_youth_audience_age = models.SmallIntegerField(
         help_text="Minimum age of youth, in years, that the organization's "
                   "programs target.",
@@ -240,11 +382,12 @@ class Organization(models.Model):
     def get_absolute_url(self):
         return reverse('organization_detail', args=(str(self.slug),))
 
+    @property
+    def rendered_mission(self):
+        return markup.get_html(self, 'mission')
+
     def membership_directory(self):
-        return self.memberships.filter(
-            is_listed=True,
-            user__is_active=True
-        ).order_by('user__last_name')
+        return self.memberships.listed()
 
     def clean(self):
         if self.max_youth_audience_age < self.min_youth_audience_age:
@@ -254,6 +397,8 @@ class Organization(models.Model):
 
     class Meta:
         ordering = ['name']
+        # For listing a city's active organizations in name order.
+        index_together = [('city', 'is_active', 'name')]
 
 class ExpertiseManager(models.Manager):
     def of_vouched_users(self):
@@ -263,6 +408,26 @@ class ExpertiseManager(models.Manager):
             user__membership__is_listed=True
         )
 
+    def counts_by_category_and_city(self):
+        '''
+        Returns a dictionary mapping expertise categories to lists of
+        (city, number of vouched users' expertises) pairs, ordered by
+        city name, using a single query.
+        '''
+
+        city = 'user__membership__organization__city'
+        rows = self.of_vouched_users().values(
+            'category', city, city + '__name', city + '__short_name'
+        ).annotate(count=models.Count('id')).order_by(city + '__name')
+        counts = {}
+        for row in rows:
+            counts.setdefault(row['category'], []).append((City(
+                id=row[city],
+                name=row[city + '__name'],
+                short_name=row[city + '__short_name']
+            ), row['count']))
+        return counts
+
 class Expertise(models.Model):
     '''
     Represents an expertise that a user has.
@@ -308,16 +473,39 @@ class Expertise(models.Model):
 
     objects = ExpertiseManager()
 
+    class Meta:
+        index_together = [('category', 'created')]
+
+class ContentChannelQuerySet(models.QuerySet):
+    def first_per_category(self):
+        '''
+        Returns only the earliest-modified channel of each organization
+        in each category that has an icon, ordered by modification time.
+        '''
+
+        table = self.model._meta.db_table
+        return self.exclude(category='other').extra(where=[
+            # This is a correlated subquery rather than DISTINCT ON or a
+            # window function, as it works on every database and can be
+            # used as the queryset of a Prefetch.
+            '''NOT EXISTS (
+                SELECT 1 FROM {table} earlier
+                WHERE earlier.organization_id = {table}.organization_id
+                AND earlier.category = {table}.category
+                AND (earlier.modified < {table}.modified OR
+                     (earlier.modified = {table}.modified AND
+                      earlier.id < {table}.id))
+            )'''.format(table=table)
+        ]).order_by('modified', 'id')
+
 class ContentChannelManager(models.Manager):
     use_for_related_fields = True
 
+    def get_queryset(self):
+        return ContentChannelQuerySet(self.model, using=self._db)
+
     def unique_with_icons(self):
-        categories = []
-        channels = self.all().exclude(category='other')
-        for channel in channels.order_by('modified'):
-            if channel.category in categories: continue
-            categories.append(channel.category)
-            yield channel
+        return self.get_queryset().first_per_category()
 
 class ContentChannel(models.Model):
     '''
@@ -398,6 +586,10 @@ class ContentChannel(models.Model):
 
     objects = ContentChannelManager()
 
+    class Meta:
+        # For finding each organization's first channel of a category.
+        index_together = [('organization', 'category', 'modified')]
+
 class MembershipRole(models.Model):
     '''
     Represents a role for a person in the Hive organization, e.g.
@@ -424,6 +616,45 @@ class MembershipRole(models.Model):
     class Meta:
         ordering = ['name']
 
+class MembershipQuerySet(models.QuerySet):
+    def listed(self):
+        '''
+        Returns only the listed memberships of active users, along with
+        their users, ordered by last name.
+        '''
+
+        return self.filter(
+            is_listed=True,
+            user__is_active=True
+        ).select_related('user').order_by('user__last_name', 'id')
+
+    def update_email_hashes(self):
+        '''
+        Updates the email hashes of memberships whose hash doesn't match
+        their user's email address, e.g. because they were loaded from
+        a fixture, and returns how many were updated.
+        '''
+
+        updated = 0
+        for membership_id, email, email_hash in self.values_list(
+                'id', 'user__email', 'email_hash').iterator():
+            new_hash = get_email_hash(email)
+            if new_hash != email_hash:
+                self.model.objects.filter(id=membership_id).update(
+                    email_hash=new_hash
+                )
+                updated += 1
+        return updated
+
+class MembershipManager(models.Manager):
+    use_for_related_fields = True
+
+    def get_queryset(self):
+        return MembershipQuerySet(self.model, using=self._db)
+
+    def listed(self):
+        return self.get_queryset().listed()
+
 class Membership(models.Model):
     '''
     Represents a person who is a member of an organization.
@@ -431,6 +662,11 @@ class Membership(models.Model):
 
     city_editor_permissions = ('change',)
 
+    # Fields shown in the directory, changes to which are recorded as
+    # profile edits by directory.signals.
+    PROFILE_FIELDS = ('title', 'bio', 'twitter_name', 'phone_number',
+                      'is_listed')
+
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
     user = models.OneToOneField(User)
@@ -447,6 +683,16 @@ class Membership(models.Model):
                   "and basic HTML tags are allowed.",
         blank=True,
     )
+    bio_html = models.TextField(blank=True, editable=False)
+    bio_html_key = models.CharField(max_length=40, blank=True,
+                                    editable=False)
+    email_hash = models.CharField(
+        help_text="The Gravatar hash of the person's email address. "
+                  "This is kept up-to-date automatically.",
+        max_length=32,
+        blank=True,
+        editable=False
+    )
     twitter_name = TwitterNameField(
         help_text="The twitter account for the person.",
         blank=True,
@@ -466,17 +712,26 @@ class Membership(models.Model):
                   "the Hive directory."
     )
 
+    objects = MembershipManager()
+
     @property
     def city(self):
         if self.organization is None: return None
         return self.organization.city
 
+    @property
+    def rendered_bio(self):
+        return markup.get_html(self, 'bio')
+
     def get_absolute_url(self):
         return reverse('user_detail', args=(str(self.user.username),))
 
     def __unicode__(self):
         return u'Membership for %s' % self.user.username
 
+    class Meta:
+        index_together = [('organization', 'is_listed')]
+
 class ImportedUserInfo(models.Model):
     '''
     Represents book-keeping about users who were imported from another
@@ -494,3 +749,112 @@ class ImportedUserInfo(models.Model):
 
     def __unicode__(self):
         return u'Imported user info for %s' % self.user.username
+
+class SearchEntry(models.Model):
+    '''
+    Represents a single token in the inverted index used to search
+    a city's directory. Each entry points at either an organization or
+    a membership; see directory.search for details.
+    '''
+
+    city = models.ForeignKey(City, related_name='+')
+    token = models.CharField(max_length=50)
+    weight = models.SmallIntegerField()
+    organization = models.ForeignKey(Organization, null=True,
+                                     related_name='+')
+    membership = models.ForeignKey(Membership, null=True,
+                                   related_name='+')
+
+    class Meta:
+        index_together = [('city', 'token')]
+
+class SearchDocument(models.Model):
+    '''
+    Represents the searchable text of an organization or membership,
+    for search backends that use the database's own full-text
+    indexing. See directory.search_backends for details.
+    '''
+
+    city = models.ForeignKey(City, related_name='+')
+    organization = models.OneToOneField(Organization, null=True,
+                                        related_name='+')
+    membership = models.OneToOneField(Membership, null=True,
+                                      related_name='+')
+    name = models.TextField()
+    title = models.TextField()
+    labels = models.TextField()
+    text = models.TextField()
+
+class EmailDomain(models.Model):
+    '''
+    Represents the normalized email domain of an organization, with its
+    labels reversed, so that affiliations can be found by an indexed
+    lookup that also matches subdomains. These are kept in sync with
+    Organization.email_domain by directory.signals.
+    '''
+
+    organization = models.OneToOneField(Organization, related_name='+')
+    reversed_name = models.CharField(max_length=50, db_index=True)
+
+    @classmethod
+    def update_for(cls, org):
+        cls.objects.filter(organization=org).delete()
+        if org.email_domain:
+            cls(organization=org,
+                reversed_name=reverse_domain(org.email_domain)).save()
+
+class ActivityEvent(models.Model):
+    '''
+    Represents something that happened in a city's directory, such as
+    a member editing their profile. Events are only ever added, by
+    directory.signals, and are read newest first by the city's
+    activity page. The names of the user and organization involved are
+    stored along with them, so events outlive their deletion.
+    '''
+
+    KIND_CHOICES = (
+        ('member_joined', 'joined'),
+        ('profile_edited', 'updated their profile'),
+        ('org_added', 'was added to the directory'),
+        ('org_edited', 'was updated'),
+        ('channel_changed', 'updated its channels'),
+    )
+
+    city = models.ForeignKey(City, related_name='+')
+    created = models.DateTimeField(auto_now_add=True)
+    kind = models.CharField(max_length=25, choices=KIND_CHOICES)
+    organization = models.ForeignKey(Organization, null=True,
+                                     related_name='+',
+                                     on_delete=models.SET_NULL)
+    organization_name = models.CharField(max_length=100, blank=True)
+    user = models.ForeignKey(User, null=True, related_name='+',
+                             on_delete=models.SET_NULL)
+    username = models.CharField(max_length=30, blank=True)
+
+    @classmethod
+    def record(cls, kind, organization, user=None):
+        cls(city_id=organization.city_id, kind=kind,
+            organization=organization, organization_name=organization.name,
+            user=user, username=user.username if user else '').save()
+
+    @property
+    def subject(self):
+        '''
+        The user or organization that the event is about, or None if
+        it has since been deleted.
+        '''
+
+        if self.username:
+            return self.user
+        return self.organization
+
+    @property
+    def subject_name(self):
+        return self.username or self.organization_name
+
+    def __unicode__(self):
+        return u'%s %s' % (self.subject_name, self.get_kind_display())
+
+    class Meta:
+        ordering = ['-created']
+        index_together = [('city', 'created')]
@@ -1,10 +1,10 @@
 from functools import wraps
-from django.http import HttpResponseNotFound
+from django.http import HttpResponseNotFound, Http404
 from django.conf import settings
-from django.shortcuts import get_object_or_404
-from django.core.urlresolvers import reverse
+from django.core.urlresolvers import reverse, get_script_prefix, \
+                                     get_urlconf, NoReverseMatch
 
-from .models import City, get_current_city
+from .models import get_current_city, get_city_by_slug
 
 MULTI_CITY_SITE_VIEWNAME_PREFIX = 'explicit_city_'
 SINGLE_CITY_SITE_VIEWNAME_PREFIX = 'implicit_city_'
@@ -25,7 +25,9 @@ def city_scoped(f):
             if site_city:
                 # But if we're a single-city site, return 404.
                 return HttpResponseNotFound()
-            city = get_object_or_404(City, slug=city)
+            city = get_city_by_slug(city)
+            if city is None:
+                raise Http404
         return f(request, city=city, **kwargs)
     return wrapped
 
@@ -33,12 +35,43 @@ def viewname_prefix(is_multi_city_site):
     if is_multi_city_site: return MULTI_CITY_SITE_VIEWNAME_PREFIX
     return SINGLE_CITY_SITE_VIEWNAME_PREFIX
 
+# Maps (URLconf, script prefix, city slug) tuples to the URL tables
+# built by build_city_urls().
+_city_urls = {}
+
+def build_city_urls(city_slug=None):
+    '''
+    Returns a dictionary mapping the name of every city-scoped view,
+    without its prefix, to its URL for the city with the given slug, or
+    for the current single-city site if no slug is given.
+    '''
+
+    from .urls import city_scoped_directory_patterns
+
+    is_multi_city_site = city_slug is not None
+    prefix = viewname_prefix(is_multi_city_site)
+    kwargs = {'city': city_slug} if is_multi_city_site else {}
+    return dict(
+        (pattern.name[len(prefix):], reverse(pattern.name, kwargs=kwargs))
+        for pattern in city_scoped_directory_patterns(is_multi_city_site)
+    )
+
+def get_city_urls(city_slug=None):
+    key = (get_urlconf() or settings.ROOT_URLCONF, get_script_prefix(),
+           city_slug)
+    if key not in _city_urls:
+        _city_urls[key] = build_city_urls(city_slug)
+    return _city_urls[key]
+
 def city_reverse(request, viewname):
     if not is_multi_city(request):
-        return reverse(SINGLE_CITY_SITE_VIEWNAME_PREFIX + viewname)
-    return reverse(MULTI_CITY_SITE_VIEWNAME_PREFIX + viewname, kwargs={
-        'city': request.resolver_match.kwargs['city']
-    })
+        urls = get_city_urls()
+    else:
+        urls = get_city_urls(request.resolver_match.kwargs['city'])
+    try:
+        return urls[viewname]
+    except KeyError:
+        raise NoReverseMatch('%r is not a city-scoped view name' % viewname)
 
 def is_multi_city(request=None):
     return get_current_city(request) is None
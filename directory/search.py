@@ -0,0 +1,368 @@
+'''
+Full-text search of a city's directory.
+
+Every active organization and every listed, active membership with an
+organization is indexed as a handful of weighted fields, so that e.g.
+a hit on an organization's name ranks above a hit on its mission. How
+those fields are stored and queried is up to the search backend named
+by ``settings.SEARCH_BACKEND``; see directory.search_backends.
+
+The index is kept up-to-date incrementally by the signal handlers in
+directory.signals. To rebuild it from scratch, e.g. after switching
+backends, run the ``rebuildsearchindex`` management command.
+'''
+
+import re
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.utils.html import strip_tags, escape
+from django.utils.safestring import mark_safe
+from django.utils.module_loading import import_string
+
+from .models import Organization, Membership, SearchEntry, SearchDocument
+
+NAME_WEIGHT = 10
+TITLE_WEIGHT = 4
+LABEL_WEIGHT = 2
+TEXT_WEIGHT = 1
+
+FIELD_WEIGHTS = (
+    ('name', NAME_WEIGHT),
+    ('title', TITLE_WEIGHT),
+    ('labels', LABEL_WEIGHT),
+    ('text', TEXT_WEIGHT),
+)
+
+RESULTS_PER_PAGE = 20
+
+# The approximate maximum length of a snippet, in characters.
+SNIPPET_LENGTH = 200
+
+MAX_TOKEN_LENGTH = SearchEntry._meta.get_field('token').max_length
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_backends = {}
+
+def get_backend():
+    path = settings.SEARCH_BACKEND
+    if path not in _backends:
+        backend = import_string(path)()
+        if not backend.is_available():
+            backend = import_string(backend.fallback)()
+        _backends[path] = backend
+    return _backends[path]
+
+def tokenize(text):
+    '''
+    Splits the given text into a list of lowercase tokens.
+
+    >>> tokenize(u'Radio <b>Rookies</b>: teens & radio!')
+    [u'radio', u'rookies', u'teens', u'radio']
+    '''
+
+    return [token[:MAX_TOKEN_LENGTH]
+            for token in TOKEN_RE.findall(strip_tags(text).lower())]
+
+def weigh_tokens(*fields):
+    '''
+    Given any number of (text, weight) pairs, returns a dictionary
+    mapping each token in the text to the highest weight it was
+    found with.
+
+    >>> sorted(weigh_tokens((u'Radio Rookies', 10), (u'radio', 1)).items())
+    [(u'radio', 10), (u'rookies', 10)]
+    '''
+
+    weights = {}
+    for text, weight in fields:
+        for token in tokenize(text):
+            if weights.get(token, 0) < weight:
+                weights[token] = weight
+    return weights
+
+def organization_fields(org):
+    '''
+    Returns a dictionary of the searchable fields of the given
+    organization, or None if it shouldn't be searchable.
+    '''
+
+    if not org.is_active:
+        return None
+    return {
+        'name': org.name,
+        'title': u'',
+        'labels': u' '.join(membership_type.name for membership_type
+                            in org.membership_types.all()),
+        'text': strip_tags(org.mission),
+    }
+
+def membership_fields(membership):
+    '''
+    Returns a dictionary of the searchable fields of the given
+    membership, or None if it shouldn't be searchable.
+    '''
+
+    user = membership.user
+    if not (membership.organization_id and membership.is_listed and
+            user.is_active):
+        return None
+    return {
+        'name': u'%s %s' % (user.first_name, user.last_name),
+        'title': membership.title,
+        'labels': u' '.join(role.name for role in membership.roles.all()),
+        'text': strip_tags(membership.bio),
+    }
+
+def weigh_fields(fields):
+    return weigh_tokens(*[(fields[name], weight)
+                          for name, weight in FIELD_WEIGHTS])
+
+def organization_entries(org, model=SearchEntry):
+    '''
+    Returns a list of unsaved search entries for the given organization.
+    '''
+
+    fields = organization_fields(org)
+    if fields is None:
+        return []
+    return [model(city_id=org.city_id, organization_id=org.id,
+                  token=token, weight=weight)
+            for token, weight in weigh_fields(fields).items()]
+
+def membership_entries(membership, model=SearchEntry):
+    '''
+    Returns a list of unsaved search entries for the given membership.
+    '''
+
+    fields = membership_fields(membership)
+    if fields is None:
+        return []
+    return [model(city_id=membership.organization.city_id,
+                  membership_id=membership.id,
+                  token=token, weight=weight)
+            for token, weight in weigh_fields(fields).items()]
+
+def organization_documents(org, model=SearchDocument):
+    '''
+    Returns a list containing the unsaved search document for the
+    given organization, if it should be searchable.
+    '''
+
+    fields = organization_fields(org)
+    if fields is None:
+        return []
+    return [model(city_id=org.city_id, organization_id=org.id, **fields)]
+
+def membership_documents(membership, model=SearchDocument):
+    '''
+    Returns a list containing the unsaved search document for the
+    given membership, if it should be searchable.
+    '''
+
+    fields = membership_fields(membership)
+    if fields is None:
+        return []
+    return [model(city_id=membership.organization.city_id,
+                  membership_id=membership.id, **fields)]
+
+def index_organization(org):
+    get_backend().index_organization(org)
+
+def index_membership(membership):
+    get_backend().index_membership(membership)
+
+def rebuild_index():
+    '''
+    Throws away the entire search index and rebuilds it.
+    '''
+
+    backend = get_backend()
+    backend.clear()
+    orgs = Organization.objects.filter(is_active=True) \
+             .prefetch_related('membership_types')
+    for org in orgs:
+        backend.index_organization(org)
+    memberships = Membership.objects.filter(
+        is_listed=True,
+        user__is_active=True,
+        organization__isnull=False
+    ).select_related('user', 'organization').prefetch_related('roles')
+    for membership in memberships:
+        backend.index_membership(membership)
+
+class Ranking(object):
+    '''
+    The results of searching the index for a query, which the search
+    backend only counts or fetches when asked to. Slicing a Ranking
+    returns a list of (organization id, membership id) pairs, so it can
+    be paginated without fetching every match.
+    '''
+
+    def __init__(self, query, city=None, include_people=False):
+        self.tokens = sorted(set(tokenize(query)))
+        self.city = city
+        self.include_people = include_people
+
+    def count(self):
+        if not self.tokens:
+            return 0
+        return get_backend().count(self.tokens, self.city,
+                                   self.include_people)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step is not None:
+            raise TypeError('Rankings can only be sliced')
+        if not self.tokens:
+            return []
+        return get_backend().rank(self.tokens, self.city,
+                                  self.include_people, index.start or 0,
+                                  index.stop)
+
+def rank(query, city=None, include_people=False):
+    '''
+    Searches the index for the given query and returns a list of
+    (organization id, membership id) pairs, ordered from most to least
+    relevant. One id of each pair is always None. Every token in the
+    query must prefix-match at least one token of a result.
+
+    If a city is given, results are limited to that city.
+    '''
+
+    return Ranking(query, city, include_people)[:]
+
+def split_ranking(ranking):
+    '''
+    Splits a list of (organization id, membership id) pairs into a
+    tuple of (organization ids, membership ids), keeping their order.
+
+    >>> split_ranking([(1, None), (None, 5), (2, None)])
+    ([1, 2], [5])
+    '''
+
+    org_ids = [org_id for org_id, _ in ranking if org_id]
+    membership_ids = [membership_id for _, membership_id in ranking
+                      if membership_id]
+    return org_ids, membership_ids
+
+def in_order(objects, ids):
+    '''
+    Orders the given model instances to match the given list of ids.
+    '''
+
+    by_id = dict((obj.id, obj) for obj in objects)
+    return [by_id[obj_id] for obj_id in ids if obj_id in by_id]
+
+def fetch(ranking):
+    '''
+    Given a list of (organization id, membership id) pairs, returns a
+    tuple of the (organizations, memberships) they refer to, keeping
+    their order.
+    '''
+
+    org_ids, membership_ids = split_ranking(ranking)
+    orgs = in_order(Organization.objects.filter(
+        id__in=org_ids,
+        is_active=True
+    ).select_related('city'), org_ids)
+    memberships = in_order(Membership.objects.filter(
+        id__in=membership_ids,
+        is_listed=True,
+        user__is_active=True
+    ).select_related('user', 'organization__city'), membership_ids)
+    return orgs, memberships
+
+def group_by_city(orgs, memberships):
+    '''
+    Groups the given organizations and memberships by city, returning
+    a list of (city, organizations, memberships) tuples. Cities are
+    listed in the order their first result appears, so if the given
+    results are ordered by relevance, so are the cities.
+    '''
+
+    groups = {}
+    cities = []
+    def group_for(city):
+        if city.id not in groups:
+            groups[city.id] = (city, [], [])
+            cities.append(city.id)
+        return groups[city.id]
+    for org in orgs:
+        group_for(org.city)[1].append(org)
+    for membership in memberships:
+        group_for(membership.organization.city)[2].append(membership)
+    return [groups[city_id] for city_id in cities]
+
+def search(query, city=None, include_people=False):
+    '''
+    Searches the index for the given query and returns a tuple of
+    (organizations, memberships), each ordered from most to least
+    relevant.
+    '''
+
+    return fetch(rank(query, city, include_people))
+
+def search_page(query, page, city=None, include_people=False,
+                per_page=None):
+    '''
+    Like search(), but only fetches the given page of results. Returns
+    a Page whose object list is a tuple of (organizations, memberships),
+    each of which has a ``snippet`` attribute containing highlighted
+    HTML from its mission or bio.
+
+    Raises the same exceptions as Paginator.page() for invalid pages.
+    '''
+
+    paginator = Paginator(Ranking(query, city, include_people),
+                          per_page or RESULTS_PER_PAGE)
+    page = paginator.page(page)
+    orgs, memberships = fetch(page.object_list)
+    tokens = tokenize(query)
+    for org in orgs:
+        org.snippet = make_snippet(org.mission, tokens)
+    for membership in memberships:
+        membership.snippet = make_snippet(membership.bio, tokens)
+    page.object_list = (orgs, memberships)
+    return page
+
+def make_snippet(text, tokens, length=SNIPPET_LENGTH):
+    '''
+    Returns a short excerpt of the given text as HTML, centered on the
+    first word beginning with any of the given tokens, and with all
+    such words highlighted.
+
+    >>> print make_snippet(u'I <b>like</b> radio & tv.', [u'radio'])
+    I like <mark>radio</mark> &amp; tv.
+    >>> print make_snippet(u'one two three four five', [u'four'], 12)
+    &hellip; three <mark>four</mark> &hellip;
+    '''
+
+    text = u' '.join(strip_tags(text).split())
+    pattern = re.compile(
+        r'\b(?:%s)\w*' % '|'.join(re.escape(token) for token in tokens),
+        re.IGNORECASE | re.UNICODE
+    )
+    match = tokens and pattern.search(text)
+    start = 0
+    if match and match.end() > length:
+        # Leave a bit of context before the match.
+        start = text.rfind(u' ', 0, match.start() - length // 4) + 1
+    end = start + length
+    if end < len(text):
+        end = max(text.rfind(u' ', start, end), match and match.end() or 0)
+        if end <= start:
+            end = start + length
+
+    pieces = []
+    if start > 0:
+        pieces.append(u'&hellip; ')
+    position = start
+    excerpt = text[start:end]
+    for word in (pattern.finditer(excerpt) if tokens else []):
+        pieces.append(escape(excerpt[position - start:word.start()]))
+        pieces.append(u'<mark>%s</mark>' % escape(word.group()))
+        position = start + word.end()
+    pieces.append(escape(excerpt[position - start:]))
+    if end < len(text):
+        pieces.append(u' &hellip;')
+    return mark_safe(u''.join(pieces))
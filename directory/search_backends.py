@@ -0,0 +1,320 @@
+'''
+Search backends for directory.search.
+
+Each backend knows how to store the searchable fields of organizations
+and memberships and how to find the ones matching a list of query
+tokens. The backend to use is given by ``settings.SEARCH_BACKEND``,
+which is chosen based on the database URL by
+hive.settings_utils.parse_search_backend:
+
+* ``PostgresSearchBackend`` stores one SearchDocument per object and
+  queries it through a GIN index on a weighted ``tsvector``.
+
+* ``SqliteSearchBackend`` stores one SearchDocument per object and
+  queries it through an FTS5 table kept in sync by triggers.
+
+* ``SearchEntryBackend`` stores one SearchEntry per token and object,
+  and works on any database. It's also used whenever one of the other
+  backends isn't available, e.g. if SQLite was built without FTS5.
+
+The database-specific tables and indexes are created by the
+``0004_searchdocument`` migration.
+'''
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import SearchEntry, SearchDocument
+from . import search
+
+def prefix_range(prefix):
+    '''
+    Returns the bounds of the tokens that start with the given prefix,
+    as a (lowest, highest) tuple for an index-friendly range query.
+    The upper bound is exclusive, or None if there isn't one. This
+    relies on tokens being compared by codepoint, as SQLite's default
+    BINARY collation does.
+
+    >>> prefix_range(u'art')
+    (u'art', u'aru')
+    '''
+
+    last = ord(prefix[-1])
+    if last == 0xffff:
+        return (prefix, None)
+    return (prefix, prefix[:-1] + unichr(last + 1))
+
+# Query tokens that exactly match an indexed token get this bonus,
+# so "art" ranks an org named "Art" above one named "Artisans".
+EXACT_MATCH_BONUS = 1
+
+class SearchBackend(object):
+    # The database vendor this backend requires, if any.
+    vendor = None
+
+    # The backend to use instead if this one isn't available.
+    fallback = 'directory.search_backends.SearchEntryBackend'
+
+    def is_available(self):
+        return self.vendor is None or connection.vendor == self.vendor
+
+    def clear(self):
+        raise NotImplementedError()
+
+    def index_organization(self, org):
+        raise NotImplementedError()
+
+    def index_membership(self, membership):
+        raise NotImplementedError()
+
+    def rank(self, tokens, city, include_people, start=0, stop=None):
+        '''
+        Returns a list of (organization id, membership id) pairs for the
+        objects matching all the given query tokens as prefixes, ordered
+        from most to least relevant. One id of each pair is always None.
+
+        Only the pairs from ``start`` up to ``stop`` are returned, like
+        a slice of the full list, so that a page of results can be
+        fetched without fetching every match.
+        '''
+
+        raise NotImplementedError()
+
+    def count(self, tokens, city, include_people):
+        '''
+        Returns the length of the full list rank() would return.
+        '''
+
+        raise NotImplementedError()
+
+    def fetch_ranking(self, sql, params, start, stop):
+        '''
+        Runs the given SQL, which selects the organization id, membership
+        id and score of each result in order, limited to the results
+        from ``start`` up to ``stop``.
+        '''
+
+        if stop is not None:
+            sql += ' LIMIT %s OFFSET %s'
+            params = params + [max(stop - start, 0), start]
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        ranking = [(org_id, membership_id)
+                   for org_id, membership_id, score in cursor.fetchall()]
+        if stop is None:
+            return ranking[start:]
+        return ranking
+
+    def count_rows(self, sql, params):
+        '''
+        Returns the number of rows the given SQL selects.
+        '''
+
+        cursor = connection.cursor()
+        cursor.execute('SELECT COUNT(*) FROM (%s) AS results' % sql, params)
+        return cursor.fetchone()[0]
+
+class SearchEntryBackend(SearchBackend):
+    '''
+    A token-level inverted index, stored as SearchEntry rows keyed by
+    city and token, that works on any database.
+    '''
+
+    def clear(self):
+        SearchEntry.objects.all().delete()
+
+    def index_organization(self, org):
+        SearchEntry.objects.filter(organization=org).delete()
+        SearchEntry.objects.bulk_create(search.organization_entries(org))
+        # The organization may have moved to a different city.
+        SearchEntry.objects.filter(membership__organization=org) \
+                           .update(city=org.city_id)
+
+    def index_membership(self, membership):
+        SearchEntry.objects.filter(membership=membership).delete()
+        SearchEntry.objects.bulk_create(
+            search.membership_entries(membership)
+        )
+
+    def matching_entries(self, tokens, city, include_people):
+        q = Q()
+        for token in tokens:
+            lowest, highest = prefix_range(token)
+            if highest is None:
+                q |= Q(token__gte=lowest)
+            else:
+                q |= Q(token__gte=lowest, token__lt=highest)
+        entries = SearchEntry.objects.filter(q)
+        if city is not None:
+            entries = entries.filter(city=city)
+        if not include_people:
+            entries = entries.filter(membership__isnull=True)
+        return entries
+
+    def get_ranking_sql(self, tokens, city, include_people):
+        '''
+        Returns SQL and parameters that select the organization id,
+        membership id and score of each object matching all the given
+        tokens, where higher scores are better. Each token scores the
+        highest weight of the entries it prefixes, plus a bonus if it
+        matches one exactly.
+        '''
+
+        entries = self.matching_entries(tokens, city, include_people)
+        sql, entry_params = entries.values_list(
+            'token', 'organization_id', 'membership_id', 'weight'
+        ).query.sql_with_params()
+        columns = []
+        params = []
+        for i, token in enumerate(tokens):
+            lowest, highest = prefix_range(token)
+            if highest is None:
+                prefixed = 'e.token >= %s'
+                params += [token, EXACT_MATCH_BONUS, lowest]
+            else:
+                prefixed = 'e.token >= %s AND e.token < %s'
+                params += [token, EXACT_MATCH_BONUS, lowest, highest]
+            columns.append(
+                'MAX(CASE WHEN e.token = %s THEN e.weight + %s '
+                'WHEN {0} THEN e.weight ELSE 0 END) AS s{1}'
+                .format(prefixed, i)
+            )
+        params += entry_params
+        return ((
+            'SELECT organization_id, membership_id, {total} AS score '
+            'FROM (SELECT e.organization_id, e.membership_id, {columns} '
+            'FROM ({entries}) AS e '
+            'GROUP BY e.organization_id, e.membership_id) AS hits '
+            'WHERE {all_matched}'
+        ).format(
+            total=' + '.join('s%d' % i for i in range(len(tokens))),
+            columns=', '.join(columns),
+            entries=sql,
+            all_matched=' AND '.join('s%d > 0' % i
+                                     for i in range(len(tokens)))
+        ), params)
+
+    def rank(self, tokens, city, include_people, start=0, stop=None):
+        sql, params = self.get_ranking_sql(tokens, city, include_people)
+        # Memberships come first among equal scores, as they would if
+        # the pairs were sorted in Python.
+        sql += (' ORDER BY score DESC, COALESCE(organization_id, 0), '
+                'COALESCE(membership_id, 0)')
+        return self.fetch_ranking(sql, params, start, stop)
+
+    def count(self, tokens, city, include_people):
+        return self.count_rows(*self.get_ranking_sql(tokens, city,
+                                                     include_people))
+
+class SearchDocumentBackend(SearchBackend):
+    '''
+    Base class for backends that store a SearchDocument per object and
+    leave the indexing of its text to the database.
+    '''
+
+    def clear(self):
+        SearchDocument.objects.all().delete()
+
+    def index_organization(self, org):
+        SearchDocument.objects.filter(organization=org).delete()
+        SearchDocument.objects.bulk_create(
+            search.organization_documents(org)
+        )
+        SearchDocument.objects.filter(membership__organization=org) \
+                              .update(city=org.city_id)
+
+    def index_membership(self, membership):
+        SearchDocument.objects.filter(membership=membership).delete()
+        SearchDocument.objects.bulk_create(
+            search.membership_documents(membership)
+        )
+
+    def filter_ranking_sql(self, tokens, city, include_people):
+        sql, params = self.get_ranking_sql(tokens)
+        if city is not None:
+            sql += ' AND d.city_id = %s'
+            params.append(city.id)
+        if not include_people:
+            sql += ' AND d.membership_id IS NULL'
+        return sql, params
+
+    def rank(self, tokens, city, include_people, start=0, stop=None):
+        sql, params = self.filter_ranking_sql(tokens, city, include_people)
+        sql += ' ORDER BY score, d.id'
+        return self.fetch_ranking(sql, params, start, stop)
+
+    def count(self, tokens, city, include_people):
+        return self.count_rows(*self.filter_ranking_sql(tokens, city,
+                                                        include_people))
+
+    def get_ranking_sql(self, tokens):
+        '''
+        Returns SQL and parameters that select the organization id,
+        membership id and score of each document (aliased as ``d``)
+        matching all the given tokens, where lower scores are better.
+        The SQL must end in a WHERE clause that can be extended with
+        further conditions, and is then ordered, limited and counted
+        by the database.
+        '''
+
+        raise NotImplementedError()
+
+class SqliteSearchBackend(SearchDocumentBackend):
+    '''
+    Searches SearchDocuments through an FTS5 virtual table.
+    '''
+
+    vendor = 'sqlite'
+
+    FTS_TABLE = 'directory_searchdocument_fts'
+
+    @classmethod
+    def is_fts5_supported(cls, connection):
+        cursor = connection.cursor()
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+    def is_available(self):
+        # The FTS5 table is only created by our migration if SQLite
+        # supports it.
+        return (super(SqliteSearchBackend, self).is_available() and
+                self.FTS_TABLE in connection.introspection.table_names())
+
+    def get_ranking_sql(self, tokens):
+        weights = ', '.join('%.1f' % weight
+                            for _, weight in search.FIELD_WEIGHTS)
+        return ((
+            'SELECT d.organization_id, d.membership_id, '
+            'bm25({fts}, {weights}) AS score '
+            'FROM {fts} JOIN directory_searchdocument d '
+            'ON d.id = {fts}.rowid '
+            'WHERE {fts} MATCH %s'
+        ).format(fts=self.FTS_TABLE, weights=weights), [
+            # Each token is a prefix query, and FTS5 implicitly ANDs
+            # them together.
+            ' '.join('"%s"*' % token for token in tokens)
+        ])
+
+class PostgresSearchBackend(SearchDocumentBackend):
+    '''
+    Searches SearchDocuments through a GIN index on their tsvector.
+    '''
+
+    vendor = 'postgresql'
+
+    # This must be kept in sync with the expression of the GIN index
+    # created by the 0004_searchdocument migration, or Postgres won't
+    # use the index.
+    TSVECTOR = ("setweight(to_tsvector('simple', name), 'A') || "
+                "setweight(to_tsvector('simple', title), 'B') || "
+                "setweight(to_tsvector('simple', labels), 'C') || "
+                "setweight(to_tsvector('simple', text), 'D')")
+
+    def get_ranking_sql(self, tokens):
+        tsquery = ' & '.join('%s:*' % token for token in tokens)
+        return ((
+            'SELECT d.organization_id, d.membership_id, '
+            "-ts_rank({tsvector}, to_tsquery('simple', %s)) AS score "
+            'FROM directory_searchdocument d '
+            "WHERE ({tsvector}) @@ to_tsquery('simple', %s)"
+        ).format(tsvector=self.TSVECTOR), [tsquery, tsquery])
@@ -1,11 +1,39 @@
 from django.dispatch import receiver
 from django.contrib.sites.models import Site
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, pre_delete, \
+                                      post_delete, post_init, m2m_changed
 from django.contrib.auth.signals import user_logged_in
 from django.contrib import messages
 from registration.signals import user_activated
 
-from .models import City, User, Organization, Membership, is_user_vouched_for
+from .models import City, User, Organization, Membership, \
+                    OrganizationMembershipType, MembershipRole, \
+                    ContentChannel, Expertise, EmailDomain, ActivityEvent, \
+                    is_user_vouched_for, get_email_hash
+from .data_version import bump_version
+from . import search, markup
+
+# Changes to any of these models bump the directory's data version.
+VERSIONED_MODELS = (Site, City, Organization, OrganizationMembershipType,
+                    ContentChannel, MembershipRole, Membership, Expertise,
+                    User, Organization.membership_types.through,
+                    Membership.roles.through)
+
+def bump_data_version(update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= set(['last_login']):
+        # Logging in doesn't change anything we care about.
+        return
+    bump_version()
+
+for model in VERSIONED_MODELS:
+    if model._meta.auto_created:
+        m2m_changed.connect(bump_data_version, sender=model,
+                            dispatch_uid='bump_data_version')
+    else:
+        post_save.connect(bump_data_version, sender=model,
+                          dispatch_uid='bump_data_version')
+        post_delete.connect(bump_data_version, sender=model,
+                            dispatch_uid='bump_data_version')
 
 @receiver(post_save, sender=City)
 def clear_site_cache_when_city_changes(**kwargs):
@@ -29,6 +57,105 @@ def auto_register_user_with_organization(sender, user, request, **kwargs):
     user.membership.organization = org
     user.membership.save()
 
+@receiver(pre_save, sender=Organization)
+def render_mission(sender, instance, **kwargs):
+    markup.update(instance, 'mission')
+
+@receiver(pre_save, sender=Membership)
+def render_bio(sender, instance, **kwargs):
+    markup.update(instance, 'bio')
+
+@receiver(pre_save, sender=Membership)
+def set_email_hash(sender, raw, instance, **kwargs):
+    if raw: return
+    instance.email_hash = get_email_hash(instance.user.email)
+
+@receiver(post_save, sender=User)
+def update_email_hash(sender, raw, instance, update_fields=None, **kwargs):
+    if raw: return
+    if update_fields and 'email' not in update_fields: return
+    email_hash = get_email_hash(instance.email)
+    Membership.objects.filter(user=instance) \
+                      .exclude(email_hash=email_hash) \
+                      .update(email_hash=email_hash)
+
+@receiver(post_save, sender=Organization)
+def update_email_domain(sender, instance, **kwargs):
+    EmailDomain.update_for(instance)
+
+def get_membership_state(membership):
+    return dict((name, getattr(membership, name)) for name in
+                ('organization_id',) + Membership.PROFILE_FIELDS)
+
+@receiver(post_init, sender=Membership)
+def remember_membership_state(sender, instance, **kwargs):
+    # This is what the membership looks like in the database, so that
+    # we can tell what a save changes without querying for it.
+    instance._saved_state = None
+    if instance.pk is not None:
+        instance._saved_state = get_membership_state(instance)
+
+@receiver(post_save, sender=Membership)
+def record_membership_activity(sender, raw, instance, **kwargs):
+    previous = instance._saved_state
+    instance._saved_state = get_membership_state(instance)
+    if raw or not instance.organization_id: return
+    if (previous is None or
+            previous['organization_id'] != instance.organization_id):
+        kind = 'member_joined'
+    elif previous != instance._saved_state:
+        kind = 'profile_edited'
+    else:
+        return
+    ActivityEvent.record(kind, instance.organization, instance.user)
+
+def get_organization_state(org):
+    return dict((name, getattr(org, name))
+                for name in Organization.PROFILE_FIELDS)
+
+@receiver(post_init, sender=Organization)
+def remember_organization_state(sender, instance, **kwargs):
+    # Like remember_membership_state().
+    instance._saved_state = None
+    if instance.pk is not None:
+        instance._saved_state = get_organization_state(instance)
+
+@receiver(post_save, sender=Organization)
+def record_organization_activity(sender, raw, created, instance, **kwargs):
+    previous = instance._saved_state
+    instance._saved_state = get_organization_state(instance)
+    if raw: return
+    if created:
+        kind = 'org_added'
+    elif previous != instance._saved_state:
+        kind = 'org_edited'
+    else:
+        return
+    ActivityEvent.record(kind, instance)
+
+# The ids of organizations being deleted. Their channels are deleted
+# along with them, which isn't worth recording, and an event recorded
+# then would refer to an organization that's about to be gone.
+deleted_organization_ids = set()
+
+@receiver(pre_delete, sender=Organization)
+def remember_organization_deletion(sender, instance, **kwargs):
+    deleted_organization_ids.add(instance.pk)
+
+@receiver(post_delete, sender=Organization)
+def forget_organization_deletion(sender, instance, **kwargs):
+    deleted_organization_ids.discard(instance.pk)
+
+@receiver(post_save, sender=ContentChannel)
+def record_channel_activity(sender, raw, instance, **kwargs):
+    if raw: return
+    ActivityEvent.record('channel_changed', instance.organization)
+
+@receiver(post_delete, sender=ContentChannel)
+def record_channel_deletion(sender, instance, **kwargs):
+    if instance.organization_id in deleted_organization_ids: return
+    ActivityEvent.record('channel_changed', instance.organization)
+
 @receiver(user_logged_in)
 def tell_user_to_update_their_profile(sender, user, request, **kwargs):
     if not is_user_vouched_for(user): return
@@ -39,3 +166,57 @@ def tell_user_to_update_their_profile(sender, user, request, **kwargs):
                       'Just visit your user profile by accessing the '
                       'user menu at the top-right corner of this page.',
                       fail_silently=True)
+
+@receiver(post_save, sender=Organization)
+def index_organization(sender, raw, instance, **kwargs):
+    if raw: return
+    search.index_organization(instance)
+
+@receiver(post_save, sender=Membership)
+def index_membership(sender, raw, instance, **kwargs):
+    if raw: return
+    search.index_membership(instance)
+
+@receiver(post_save, sender=User)
+def index_user_membership(sender, raw, instance, update_fields, **kwargs):
+    if raw: return
+    if update_fields is not None and not (set(update_fields) &
+                                          set(['first_name', 'last_name',
+                                               'is_active'])):
+        # This is probably just a login updating last_login.
+        return
+    for membership in Membership.objects.filter(user=instance):
+        membership.user = instance
+        search.index_membership(membership)
+
+@receiver(post_save, sender=OrganizationMembershipType)
+def index_orgs_with_membership_type(sender, raw, instance, **kwargs):
+    if raw: return
+    for org in instance.orgs.all():
+        search.index_organization(org)
+
+@receiver(post_save, sender=MembershipRole)
+def index_memberships_with_role(sender, raw, instance, **kwargs):
+    if raw: return
+    for membership in instance.membership_set.all():
+        search.index_membership(membership)
+
+@receiver(m2m_changed, sender=Organization.membership_types.through)
+def index_orgs_when_membership_types_change(sender, instance, action,
+                                            reverse, pk_set, **kwargs):
+    if not action.startswith('post_'): return
+    if not reverse:
+        search.index_organization(instance)
+    elif pk_set:
+        for org in Organization.objects.filter(pk__in=pk_set):
+            search.index_organization(org)
+
+@receiver(m2m_changed, sender=Membership.roles.through)
+def index_memberships_when_roles_change(sender, instance, action,
+                                        reverse, pk_set, **kwargs):
+    if not action.startswith('post_'): return
+    if not reverse:
+        search.index_membership(instance)
+    elif pk_set:
+        for membership in Membership.objects.filter(pk__in=pk_set):
+            search.index_membership(membership)
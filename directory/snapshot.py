@@ -0,0 +1,316 @@
+'''
+Immutable, in-memory snapshots of each city's public directory data.
+'''
+
+import threading
+from django.conf import settings
+from django.db import connection
+from django.core.urlresolvers import reverse
+
+from .models import City, Organization, OrganizationMembershipType, \
+                    ContentChannel, Membership
+from .data_version import get_version, WorkerCache
+
+class Snapshot(object):
+    '''
+    Base class for immutable records, whose attributes are given as
+    keyword arguments.
+
+    >>> t = MembershipTypeSnapshot(id=1, name=u'Partner', description=u'')
+    >>> t.name
+    u'Partner'
+    >>> t.name = u'Member'
+    Traceback (most recent call last):
+    ...
+    AttributeError: MembershipTypeSnapshot is immutable
+    '''
+
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError('%s is immutable' % type(self).__name__)
+
+class RelatedSnapshots(tuple):
+    '''
+    A tuple of related snapshots which, like a related manager, has an
+    ``all()`` method, so templates can treat both alike.
+    '''
+
+    __slots__ = ()
+
+    def all(self):
+        return self
+
+class MembershipTypeSnapshot(Snapshot):
+    __slots__ = ('id', 'name', 'description')
+
+class ChannelSnapshot(Snapshot):
+    __slots__ = ('category', 'url', 'fa_icon', 'display_name')
+
+class UserSnapshot(Snapshot):
+    __slots__ = ('id', 'username', 'email', 'first_name', 'last_name')
+
+    def get_full_name(self):
+        return (u'%s %s' % (self.first_name, self.last_name)).strip()
+
+class MembershipSnapshot(Snapshot):
+    __slots__ = ('id', 'user', 'organization_id', 'title', 'email_hash',
+                 'phone_number', 'twitter_name')
+
+    def get_absolute_url(self):
+        return reverse('user_detail', args=(str(self.user.username),))
+
+class OrganizationSnapshot(Snapshot):
+    __slots__ = ('id', 'city', 'name', 'slug', 'website', 'twitter_name',
+                 'hive_member_since', 'min_youth_audience_age',
+                 'max_youth_audience_age', 'rendered_mission',
+                 'membership_types', 'channels', 'memberships')
+
+    def get_absolute_url(self):
+        return reverse('organization_detail', args=(self.slug,))
+
+    def unique_channels_with_icons(self):
+        return self.channels
+
+    def membership_directory(self):
+        return self.memberships[:Organization.MEMBERSHIP_DIRECTORY_PREVIEW]
+
+    def has_more_members(self):
+        return (len(self.memberships) >
+                Organization.MEMBERSHIP_DIRECTORY_PREVIEW)
+
+class CitySnapshot(object):
+    '''
+    A city's active organizations, ordered by sort_key(), along with
+    its membership types and the listed members of all its
+    organizations.
+    '''
+
+    __slots__ = ('city', 'orgs', 'orgs_by_id', 'orgs_by_slug',
+                 'membership_types', 'memberships', 'indexes')
+
+    def __init__(self, city, orgs, membership_types, memberships):
+        self.city = city
+        self.orgs = tuple(orgs)
+        self.orgs_by_id = dict((org.id, org) for org in self.orgs)
+        self.orgs_by_slug = dict((org.slug, org) for org in self.orgs)
+        self.membership_types = tuple(membership_types)
+        self.memberships = tuple(memberships)
+        self.indexes = {}
+
+    def get_index(self, name):
+        '''
+        Returns the named index derived from this snapshot; see
+        register_index().
+        '''
+
+        if name not in self.indexes:
+            self.indexes[name] = index_builders[name](self)
+        return self.indexes[name]
+
+# Maps the names of indexes derived from snapshots to the functions
+# that build them.
+index_builders = {}
+
+def register_index(name, build):
+    '''
+    Registers a function that builds the named index from a
+    CitySnapshot. Registered indexes are built along with each
+    snapshot, so that requests don't wait on them.
+    '''
+
+    index_builders[name] = build
+
+def snapshot_user(user):
+    return UserSnapshot(id=user.id, username=user.username,
+                        email=user.email, first_name=user.first_name,
+                        last_name=user.last_name)
+
+def snapshot_membership(membership):
+    return MembershipSnapshot(
+        id=membership.id,
+        user=snapshot_user(membership.user),
+        organization_id=membership.organization_id,
+        title=membership.title,
+        email_hash=membership.email_hash,
+        phone_number=membership.phone_number,
+        twitter_name=membership.twitter_name
+    )
+
+def snapshot_membership_type(membership_type):
+    return MembershipTypeSnapshot(id=membership_type.id,
+                                  name=membership_type.name,
+                                  description=membership_type.description)
+
+def sort_key(name, org_id):
+    '''
+    Returns the key organizations are listed by in snapshots and in
+    everything derived from them: their name, regardless of case and
+    spacing, and then their id. Sorting in Python, rather than relying
+    on the database's collation, means cursors and binary searches
+    always compare the same way as the listing itself.
+
+    >>> sorted([sort_key(u'b', 3), sort_key(u' B', 2), sort_key(u'a', 9)])
+    [(u'a', 9), (u'b', 2), (u'b', 3)]
+    '''
+
+    return (u' '.join(name.lower().split()), org_id)
+
+def snapshot_querysets(city):
+    '''
+    Returns a dictionary of the querysets build_snapshot() fetches the
+    given city's data with.
+    '''
+
+    return {
+        'orgs': Organization.objects.filter(
+            is_active=True,
+            city=city
+        ).prefetch_related('membership_types'),
+        'channels': ContentChannel.objects.filter(
+            organization__is_active=True,
+            organization__city=city
+        ).first_per_category(),
+        'memberships': Membership.objects.filter(
+            organization__city=city
+        ).listed(),
+        'membership_types': OrganizationMembershipType.objects.filter(
+            city=city
+        ),
+    }
+
+def build_snapshot(city):
+    '''
+    Builds a CitySnapshot of the given city, in a fixed number of
+    queries regardless of how much is in it.
+    '''
+
+    querysets = snapshot_querysets(city)
+    orgs = sorted(querysets['orgs'],
+                  key=lambda org: sort_key(org.name, org.id))
+    channels = {}
+    for channel in querysets['channels']:
+        channels.setdefault(channel.organization_id, []).append(
+            ChannelSnapshot(category=channel.category, url=channel.url,
+                            fa_icon=channel.fa_icon,
+                            display_name=channel.display_name)
+        )
+    memberships = [snapshot_membership(membership)
+                   for membership in querysets['memberships']]
+    memberships_by_org = {}
+    for membership in memberships:
+        memberships_by_org.setdefault(membership.organization_id,
+                                      []).append(membership)
+
+    return CitySnapshot(
+        city=city,
+        orgs=[OrganizationSnapshot(
+            id=org.id,
+            city=city,
+            name=org.name,
+            slug=org.slug,
+            website=org.website,
+            twitter_name=org.twitter_name,
+            hive_member_since=org.hive_member_since,
+            min_youth_audience_age=org.min_youth_audience_age,
+            max_youth_audience_age=org.max_youth_audience_age,
+            rendered_mission=org.rendered_mission,
+            membership_types=RelatedSnapshots(
+                snapshot_membership_type(membership_type)
+                for membership_type in org.membership_types.all()
+            ),
+            channels=tuple(channels.get(org.id, ())),
+            memberships=tuple(memberships_by_org.get(org.id, ()))
+        ) for org in orgs],
+        membership_types=[
+            snapshot_membership_type(membership_type)
+            for membership_type in querysets['membership_types']
+        ],
+        memberships=memberships
+    )
+
+class SnapshotCache(object):
+    '''
+    Like data_version.WorkerCache, but for snapshots of cities. When
+    the data version changes, snapshots are rebuilt in a background
+    thread if ``settings.DIRECTORY_SNAPSHOT_BACKGROUND_REBUILDS`` is
+    set, with the previous ones served in the meantime.
+    '''
+
+    def __init__(self, build):
+        self.build = build
+        # Maps city ids to (data version, snapshot) tuples.
+        self.snapshots = {}
+        self.rebuilding = set()
+        self.lock = threading.Lock()
+
+    def rebuild(self, city, version):
+        snapshot = self.build(city)
+        for name in list(index_builders):
+            snapshot.get_index(name)
+        with self.lock:
+            current = self.snapshots.get(city.id)
+            if current is None or current[0] < version:
+                self.snapshots[city.id] = (version, snapshot)
+        return snapshot
+
+    def rebuild_in_background(self, city, version):
+        try:
+            self.rebuild(city, version)
+        finally:
+            with self.lock:
+                self.rebuilding.discard(city.id)
+            # Each thread has its own connection, which would otherwise
+            # be left open.
+            connection.close()
+
+    def get(self, city):
+        version = get_version()
+        current = self.snapshots.get(city.id)
+        if current is not None and current[0] == version:
+            return current[1]
+        if (current is None or
+                not settings.DIRECTORY_SNAPSHOT_BACKGROUND_REBUILDS):
+            return self.rebuild(city, version)
+        with self.lock:
+            start = city.id not in self.rebuilding
+            self.rebuilding.add(city.id)
+        if start:
+            thread = threading.Thread(target=self.rebuild_in_background,
+                                      args=(city, version))
+            thread.daemon = True
+            thread.start()
+        return current[1]
+
+snapshots = SnapshotCache(build_snapshot)
+
+def get_snapshot(city):
+    return snapshots.get(city)
+
+def get_organization_cities():
+    '''
+    Returns a dictionary mapping the slug of every active organization
+    to its city.
+    '''
+
+    slugs = Organization.objects.filter(is_active=True) \
+                                .values_list('slug', 'city_id')
+    cities = City.objects.in_bulk(set(city_id for _, city_id in slugs))
+    return dict((slug, cities[city_id]) for slug, city_id in slugs)
+
+organization_cities = WorkerCache(get_organization_cities)
+
+def get_organization(slug):
+    '''
+    Returns the OrganizationSnapshot of the active organization with
+    the given slug, or None if there isn't one.
+    '''
+
+    city = organization_cities.get().get(slug)
+    if city is None:
+        return None
+    return get_snapshot(city).orgs_by_slug.get(slug)
@@ -1,20 +1,12 @@
 import urlparse
-import hashlib
-import markdown
-import bleach
 from django import template
-from django.utils.safestring import mark_safe
 
 from ..multi_city import city_reverse
+from ..models import get_email_hash
+from .. import markup
 
 register = template.Library()
 
-ALLOWED_ATTRIBUTES = bleach.ALLOWED_ATTRIBUTES.copy()
-
-ALLOWED_ATTRIBUTES.update(**{
-    'img': ['src', 'alt']
-})
-
 @register.simple_tag(takes_context=True)
 def city_url(context, viewname):
     """
@@ -34,17 +26,12 @@ def city_url(context, viewname):
 def render_markdown(text):
     """
     Render the given markdown/HTML text as sanitized HTML.
+
+    Models with stored HTML, like Organization and Membership, should
+    use that instead, as rendering is expensive.
     """
 
-    return mark_safe(bleach.clean(
-        text=markdown.markdown(text),
-        tags=bleach.ALLOWED_TAGS + [
-            'p',
-            'pre',
-            'img'
-        ],
-        attributes=ALLOWED_ATTRIBUTES
-    ))
+    return markup.render(text)
 
 @register.filter(name='domainname')
 def get_domainname(url):
@@ -65,6 +52,10 @@ def get_emailhash(email):
     """
     Return the trimmed and lowercased MD5 hash of the given
     email address. This is useful for constructing Gravatar URLs.
+
+    Memberships store the hash of their user's email address in
+    their ``email_hash`` field, which should be used instead where
+    possible.
     """
 
-    return hashlib.md5(email.lower().strip()).hexdigest()
+    return get_email_hash(email)
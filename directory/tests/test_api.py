@@ -2,6 +2,8 @@ import json
 
 from django.test import TestCase
 
+from directory.models import Organization
+
 class ApiTests(TestCase):
     fixtures = ['wnyc.json', 'amnh.json']
 
@@ -21,3 +23,14 @@ class ApiTests(TestCase):
             {"name": "WNYC's Radio Rookies",
              "website": "http://www.radiorookies.org/"},
         ])
+
+    def test_members_can_be_filtered_by_age(self):
+        Organization.objects.filter(slug='amnh').update(
+            min_youth_audience_age=20,
+            max_youth_audience_age=99
+        )
+        response = self.get_json('/api/v1/cities/nyc/members?ages=14')
+        self.assertEqual([org['name'] for org in response.json],
+                         ["WNYC's Radio Rookies"])
+        response = self.get_json('/api/v1/cities/nyc/members?ages=15-30')
+        self.assertEqual(len(response.json), 2)
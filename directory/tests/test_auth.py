@@ -0,0 +1,70 @@
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory
+
+from django.http import HttpResponse
+
+from directory.auth import MembershipBackend, RequestPrivileges, \
+                           PrivilegesMiddleware, privileges_required
+from .test_views import WnycTestCase
+
+class MembershipBackendTests(WnycTestCase):
+    def test_get_user_loads_membership_and_organization(self):
+        user = MembershipBackend().get_user(self.wnyc_member.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(user.membership.organization.slug, 'wnyc')
+
+    def test_get_user_returns_none_for_nonexistent_users(self):
+        self.assertEqual(MembershipBackend().get_user(9999), None)
+
+    def test_authenticate_loads_membership_and_organization(self):
+        user = MembershipBackend().authenticate(username='wnyc_member',
+                                                password='lol')
+        with self.assertNumQueries(0):
+            self.assertEqual(user.membership.organization.slug, 'wnyc')
+
+    def test_authenticate_rejects_bad_credentials(self):
+        backend = MembershipBackend()
+        self.assertEqual(backend.authenticate(username='wnyc_member',
+                                              password='nope'), None)
+        self.assertEqual(backend.authenticate(username='nobody',
+                                              password='lol'), None)
+
+class RequestPrivilegesTests(WnycTestCase):
+    def test_privileges_are_computed_once(self):
+        user = MembershipBackend().get_user(self.wnyc_member.id)
+        privileges = RequestPrivileges(user)
+        with self.assertNumQueries(0):
+            self.assertTrue(privileges.is_privileged)
+            self.assertTrue(privileges.is_vouched_for)
+
+    def test_anonymous_users_are_not_privileged(self):
+        privileges = RequestPrivileges(AnonymousUser())
+        self.assertFalse(privileges.is_privileged)
+        self.assertFalse(privileges.is_vouched_for)
+
+    def test_non_members_are_not_privileged(self):
+        self.assertFalse(RequestPrivileges(self.non_member).is_privileged)
+
+    def test_middleware_sets_request_privileges(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        PrivilegesMiddleware().process_request(request)
+        self.assertFalse(request.privileges.is_privileged)
+
+class PrivilegesRequiredTests(WnycTestCase):
+    def view(self, user):
+        request = RequestFactory().get('/secret/?a=1')
+        request.user = user
+        PrivilegesMiddleware().process_request(request)
+        return privileges_required(lambda request: HttpResponse('ok'))(
+            request
+        )
+
+    def test_privileged_users_are_allowed(self):
+        self.assertEqual(self.view(self.wnyc_member).content, 'ok')
+
+    def test_unprivileged_users_are_redirected_to_login(self):
+        response = self.view(self.non_member)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'],
+                         '/accounts/login/?next=/secret/%3Fa%3D1')
@@ -0,0 +1,36 @@
+import doctest
+
+from directory import autocomplete
+from .test_views import WnycTestCase
+
+def load_tests(loader, tests, ignore):
+    tests.addTests(doctest.DocTestSuite(autocomplete))
+    return tests
+
+class AutocompleteTests(WnycTestCase):
+    def find(self, query, include_people=True):
+        return autocomplete.find(self.wnyc.city, query,
+                                 include_people=include_people)
+
+    def test_warm_queries_do_not_touch_database(self):
+        self.find('rookies')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.find('radio'), [{
+                'url': '/orgs/wnyc/',
+                'value': "WNYC's Radio Rookies"
+            }])
+
+    def test_matches_any_word_of_full_name(self):
+        expected = [{'url': '/users/wnyc_member/', 'value': 'Brian Lehrer'}]
+        self.assertEqual(self.find('brian leh'), expected)
+        self.assertEqual(self.find('lehr'), expected)
+        self.assertEqual(self.find('lehr', include_people=False), [])
+
+    def test_index_is_dropped_when_directory_changes(self):
+        self.assertEqual(self.find('public'), [])
+        self.wnyc.name = 'Public Radio'
+        self.wnyc.save()
+        self.assertEqual(self.find('public'), [{
+            'url': '/orgs/wnyc/',
+            'value': 'Public Radio'
+        }])
@@ -0,0 +1,99 @@
+import shutil
+import tempfile
+from mock import patch
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db.models.signals import post_save
+
+from directory import snapshot
+from directory.data_version import WorkerCache, get_version, \
+                                   bump_version, deferred_bumps
+from directory.snapshot import get_snapshot
+from .test_views import WnycTestCase
+
+class WorkerCacheTests(TestCase):
+    def test_values_are_built_once_per_version(self):
+        calls = []
+        cache = WorkerCache(lambda *key: calls.append(key) or len(calls))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b'), 2)
+        bump_version()
+        self.assertEqual(cache.get('a'), 3)
+        self.assertEqual(calls, [('a',), ('b',), ('a',)])
+
+    def test_bumping_changes_version(self):
+        version = get_version()
+        bump_version()
+        self.assertNotEqual(get_version(), version)
+
+class SharedCacheTests(WnycTestCase):
+    def test_edits_made_by_other_processes_are_seen(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        # Both processes share the cache, but not their memory.
+        this_process = FileBasedCache(path, {})
+        other_process = FileBasedCache(path, {})
+        city = self.wnyc.city
+        snapshot.snapshots.snapshots.clear()
+        with patch('directory.data_version.cache', this_process):
+            self.assertEqual(get_snapshot(city).orgs[0].name,
+                             "WNYC's Radio Rookies")
+        with patch('directory.data_version.cache', other_process):
+            # Signals bump the version of the process making the edit.
+            self.wnyc.name = 'Public Radio'
+            self.wnyc.save()
+        with patch('directory.data_version.cache', this_process):
+            self.assertEqual(get_snapshot(city).orgs[0].name,
+                             'Public Radio')
+            self.assertEqual(self.client.get('/').status_code, 200)
+            self.assertContains(self.client.get('/orgs/wnyc/'),
+                                'Public Radio')
+
+class DeferredBumpTests(TestCase):
+    def test_bumps_are_deferred_until_block_exits(self):
+        version = get_version()
+        with deferred_bumps():
+            bump_version()
+            with deferred_bumps():
+                bump_version()
+            self.assertEqual(get_version(), version)
+        self.assertEqual(get_version(), version + 1)
+
+    def test_nothing_is_bumped_without_changes(self):
+        version = get_version()
+        with deferred_bumps():
+            pass
+        self.assertEqual(get_version(), version)
+
+    def test_bumps_are_flushed_when_block_raises(self):
+        version = get_version()
+        with self.assertRaises(ZeroDivisionError):
+            with deferred_bumps():
+                bump_version()
+                1 / 0
+        self.assertEqual(get_version(), version + 1)
+
+class DataVersionMiddlewareTests(WnycTestCase):
+    def test_edits_bump_version_once_response_is_ready(self):
+        versions_seen_by_view = []
+        def remember_version(**kwargs):
+            versions_seen_by_view.append(get_version())
+        post_save.connect(remember_version, sender=User)
+        self.addCleanup(post_save.disconnect, remember_version, sender=User)
+
+        self.login_as_non_member()
+        version = get_version()
+        response = self.client.post('/accounts/profile/', {
+            'expertise-TOTAL_FORMS': '0',
+            'expertise-INITIAL_FORMS': '0',
+            'expertise-MAX_NUM_FORMS': '1000',
+            'user_profile-username': 'non_member',
+            'user_profile-first_name': 'Non',
+            'user_profile-last_name': 'Member'
+        })
+        self.assertRedirects(response, '/accounts/profile/')
+        self.assertTrue(versions_seen_by_view)
+        self.assertEqual(set(versions_seen_by_view), set([version]))
+        self.assertEqual(get_version(), version + 1)
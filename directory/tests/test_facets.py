@@ -0,0 +1,154 @@
+import doctest
+from mock import patch
+
+from directory import facets
+from directory.snapshot import get_snapshot
+from directory.models import Organization, OrganizationMembershipType
+from .test_views import WnycTestCase
+
+def load_tests(loader, tests, ignore):
+    tests.addTests(doctest.DocTestSuite(facets))
+    return tests
+
+class FacetTests(WnycTestCase):
+    def setUp(self):
+        super(FacetTests, self).setUp()
+        self.partner = OrganizationMembershipType(name='Partner',
+                                                  city=self.wnyc.city)
+        self.partner.save()
+        self.wnyc.membership_types.add(self.partner)
+        self.adults = Organization(name='Adult Ed', slug='adults',
+                                   website='http://example.org/',
+                                   min_youth_audience_age=19,
+                                   max_youth_audience_age=99,
+                                   city=self.wnyc.city)
+        self.adults.save()
+
+    def counts(self, name, selected=None):
+        index = facets.get_index(self.wnyc.city)
+        facet = [facet for facet in index.describe(selected or {})
+                 if facet.name == name][0]
+        return dict((value.key, value.count) for value in facet.values)
+
+    def filter(self, selected):
+        index = facets.get_index(self.wnyc.city)
+        return index.org_ids_for(index.filter(index.clean(selected)))
+
+    def test_counts_orgs_per_value(self):
+        self.assertEqual(self.counts('type'), {str(self.partner.id): 1})
+        self.assertEqual(self.counts('since'), {'2014': 1})
+        self.assertEqual(self.counts('age')['15-18'], 1)
+        self.assertEqual(self.counts('age')['19-'], 1)
+
+    def test_counts_reflect_other_facets(self):
+        self.assertEqual(self.counts('age', {'type': [str(self.partner.id)]})
+                         ['19-'], 0)
+
+    def test_filtering_returns_orgs_in_name_order(self):
+        self.assertEqual(self.filter({}), [self.adults.id, self.wnyc.id])
+        self.assertEqual(self.filter({'age': ['0-5', '19-']}),
+                         [self.adults.id, self.wnyc.id])
+        self.assertEqual(self.filter({'age': ['19-'], 'since': ['2014']}),
+                         [])
+
+    def test_invalid_values_are_ignored(self):
+        self.assertEqual(self.filter({'age': ['lol'], 'bad': ['1']}),
+                         [self.adults.id, self.wnyc.id])
+
+    def test_index_is_rebuilt_when_orgs_change(self):
+        self.assertEqual(self.counts('since'), {'2014': 1})
+        self.wnyc.hive_member_since = None
+        self.wnyc.save()
+        self.assertEqual(self.counts('since'), {})
+
+    def test_orgs_serving_ages(self):
+        city = self.wnyc.city
+        self.assertEqual(facets.orgs_serving_ages(city, 14, 14),
+                         [self.wnyc.id])
+        self.assertEqual(facets.orgs_serving_ages(city, 18, 19),
+                         [self.adults.id, self.wnyc.id])
+        self.assertEqual(facets.orgs_serving_ages(city, 100, None), [])
+
+    def test_directory_listing_is_filtered_by_age_range(self):
+        response = self.client.get('/?ages=30-40')
+        self.assertContains(response, 'Adult Ed')
+        self.assertNotContains(response, 'Radio Rookies')
+        self.assertContains(response, 'value="30-40"')
+
+    def test_directory_listing_is_filtered(self):
+        response = self.client.get('/?age=19-')
+        self.assertContains(response, 'Adult Ed')
+        self.assertNotContains(response, 'Radio Rookies')
+        self.assertContains(response, 'Clear filters')
+
+    def test_directory_listing_shows_facet_counts(self):
+        response = self.client.get('/')
+        self.assertContains(response, 'href="?since=2014"')
+        self.assertContains(response, 'Partner')
+
+    def test_pages_follow_cursors(self):
+        index = facets.get_index(self.wnyc.city)
+        first = index.page(index.all, 1)
+        self.assertEqual(list(first), [self.adults.id])
+        self.assertFalse(first.has_previous)
+        second = index.page(index.all, 1, after=first.next_cursor)
+        self.assertEqual(list(second), [self.wnyc.id])
+        self.assertFalse(second.has_next)
+        self.assertEqual(list(index.page(index.all, 1,
+                                         before=second.previous_cursor)),
+                         [self.adults.id])
+
+    def test_pages_can_be_skipped_to(self):
+        index = facets.get_index(self.wnyc.city)
+        self.assertEqual(list(index.page(index.all, 1, offset=1)),
+                         [self.wnyc.id])
+        # Like a Paginator, skipping past the end shows the last page.
+        self.assertEqual(list(index.page(index.all, 1, offset=5)),
+                         [self.wnyc.id])
+
+    def test_cursors_survive_renamed_orgs(self):
+        index = facets.get_index(self.wnyc.city)
+        cursor = index.page(index.all, 1).next_cursor
+        self.adults.name = 'Zebra Ed'
+        self.adults.save()
+        index = facets.get_index(self.wnyc.city)
+        # The page continues from where the org used to be.
+        self.assertEqual(list(index.page(index.all, 5, after=cursor)),
+                         [self.wnyc.id, self.adults.id])
+
+    def test_cursors_are_located_by_sort_key(self):
+        self.wnyc.name = 'radio rookies'
+        self.wnyc.save()
+        Organization(name='Public Radio', slug='public',
+                     website='http://example.org/',
+                     city=self.wnyc.city).save()
+        index = facets.get_index(self.wnyc.city)
+        orgs = get_snapshot(self.wnyc.city).orgs
+        self.assertEqual(index.org_ids, [org.id for org in orgs])
+        self.assertEqual([org.name for org in orgs],
+                         ['Adult Ed', 'Public Radio', 'radio rookies'])
+        # A cursor for an org that's gone resumes at its place in that
+        # order, regardless of case.
+        after = facets.encode_cursor(u'PUBLIC RADIO ZZZ', 0)
+        self.assertEqual(list(index.page(index.all, 5, after=after)),
+                         [self.wnyc.id])
+
+    def test_invalid_cursors_return_first_page(self):
+        index = facets.get_index(self.wnyc.city)
+        self.assertEqual(list(index.page(index.all, 1, after='lol')),
+                         [self.adults.id])
+
+    def test_directory_listing_is_paginated_with_cursors(self):
+        with patch('directory.views.ORGS_PER_PAGE', 1):
+            response = self.client.get('/?since=2014')
+            self.assertContains(response, 'Radio Rookies')
+            self.assertNotContains(response, 'after=')
+            response = self.client.get('/')
+            self.assertContains(response, 'Adult Ed')
+            self.assertNotContains(response, 'Radio Rookies')
+            cursor = response.context['orgs'].next_cursor
+            self.assertContains(response, 'after=%s' % cursor)
+            response = self.client.get('/', {'after': cursor})
+            self.assertNotContains(response, 'Adult Ed')
+            self.assertContains(response, 'Radio Rookies')
+            self.assertContains(response, 'before=')
@@ -0,0 +1,35 @@
+import doctest
+
+from directory import fuzzy
+from directory.snapshot import get_snapshot
+from .test_views import WnycTestCase
+
+def load_tests(loader, tests, ignore):
+    tests.addTests(doctest.DocTestSuite(fuzzy))
+    return tests
+
+class FuzzyMatchingTests(WnycTestCase):
+    def find(self, query, include_people=True):
+        return fuzzy.find(self.wnyc.city, query,
+                          include_people=include_people)
+
+    def test_finds_misspelled_org_names(self):
+        self.assertEqual(self.find('radoi rookeis'), [{
+            'url': '/orgs/wnyc/',
+            'value': "WNYC's Radio Rookies"
+        }])
+
+    def test_people_are_excluded_unless_requested(self):
+        self.assertEqual(self.find('lehrar', include_people=False), [])
+        self.assertEqual(len(self.find('lehrar')), 1)
+
+    def test_wildly_different_queries_find_nothing(self):
+        self.assertEqual(self.find('zebra'), [])
+
+    def test_short_words_must_match_exactly(self):
+        self.assertEqual(fuzzy.max_distance_for(u'ab'), 0)
+
+    def test_indexes_are_built_along_with_snapshots(self):
+        self.wnyc.save()
+        self.assertIn(('fuzzy', 'people'),
+                      get_snapshot(self.wnyc.city).indexes)
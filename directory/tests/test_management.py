@@ -1,8 +1,12 @@
 import StringIO
 from django.test import TestCase
-from django.core.management import call_command
+from django.core.management import call_command, CommandError
 from django.contrib.auth.models import Group
 
+from .test_views import WnycTestCase
+from ..models import Membership, City
+from ..management.commands.seeddata import create_user
+
 class ManagementCommandTests(TestCase):
     def test_seeddata_works_with_password(self):
         output = StringIO.StringIO()
@@ -18,3 +22,44 @@ class ManagementCommandTests(TestCase):
         call_command('initgroups', stdout=StringIO.StringIO())
         Group.objects.get(name='City Editors')
         Group.objects.get(name='Multi-City Editors')
+
+class BenchmarkQueriesTests(TestCase):
+    def test_reports_plans_and_leaves_database_alone(self):
+        output = StringIO.StringIO()
+        call_command('benchmarkqueries', orgs=3, members=2, cities=1,
+                     repeat=1, lock_tables=True, stdout=output)
+        self.assertRegexpMatches(output.getvalue(),
+                                 r'snapshot memberships: .* ms without '
+                                 r'indexes')
+        self.assertRegexpMatches(output.getvalue(), 'With indexes:')
+        self.assertEqual(City.objects.count(), 0)
+
+    def test_plans_without_indexes_are_made_without_them(self):
+        output = StringIO.StringIO()
+        call_command('benchmarkqueries', orgs=3, members=2, cities=1,
+                     repeat=1, lock_tables=True, stdout=output)
+        report = output.getvalue().split('recent activity:')[1]
+        without, with_ = report.split('Without indexes:')[1] \
+                               .split('With indexes:')
+        self.assertNotEqual(without.strip(), with_.strip())
+
+    def test_refuses_to_lock_tables_unless_told_to(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmarkqueries', stdout=StringIO.StringIO())
+        self.assertEqual(City.objects.count(), 0)
+
+class AffiliateUsersTests(WnycTestCase):
+    def test_unaffiliated_users_are_affiliated(self):
+        user = create_user('foo', email='foo@news.wnyc.org')
+        output = StringIO.StringIO()
+        call_command('affiliateusers', stdout=output)
+        self.assertRegexpMatches(output.getvalue(), '1 user')
+        self.assertEqual(Membership.objects.get(user=user)
+                         .organization, self.wnyc)
+
+    def test_dry_run_does_not_affiliate_users(self):
+        user = create_user('foo', email='foo@wnyc.org')
+        call_command('affiliateusers', dry_run=True,
+                     stdout=StringIO.StringIO())
+        self.assertEqual(Membership.objects.get(user=user)
+                         .organization, None)
@@ -6,6 +6,7 @@ from django.test import TestCase
 from django.contrib.auth.models import User
 from django.core.management import call_command
 
+from directory import dedupe
 from directory.management.commands import importorgs
 from directory.models import Organization, \
                              MembershipRole, OrganizationMembershipType
@@ -16,6 +17,7 @@ path = lambda *x: os.path.join(ROOT, *x)
 
 def load_tests(loader, tests, ignore):
     tests.addTests(doctest.DocTestSuite(importorgs))
+    tests.addTests(doctest.DocTestSuite(dedupe))
     return tests
 
 class UnitTests(unittest.TestCase):
@@ -71,3 +73,54 @@ class ImportOrgsTests(WnycTestCase):
             list(john.membership.roles.all()),
             [role]
         )
+
+class ImportOrgsDuplicateTests(WnycTestCase):
+    def import_csv(self):
+        OrganizationMembershipType(name='Ultra Org',
+                                   city=self.wnyc.city).save()
+        MembershipRole(name='Awesome Person', city=self.wnyc.city).save()
+        output = StringIO.StringIO()
+        errors = StringIO.StringIO()
+        call_command(
+            'importorgs',
+            path('test_management_importorgs.csv'),
+            city='nyc',
+            stdout=output,
+            stderr=errors
+        )
+        return output, errors
+
+    def test_importorgs_reports_no_duplicates_for_new_data(self):
+        output, errors = self.import_csv()
+        self.assertNotIn('duplicate', errors.getvalue())
+
+    def test_importorgs_reports_duplicate_orgs(self):
+        Organization(name='The American Museum of Natural History',
+                     slug='amnh', city=self.wnyc.city,
+                     website='http://amnh.org/').save()
+        output, errors = self.import_csv()
+        self.assertRegexpMatches(
+            errors.getvalue(),
+            r'row 3 \(American Museum of Natural History\) may be a '
+            r'duplicate of organization "The American Museum of Natural '
+            r'History" \(similar name\)'
+        )
+
+    def test_importorgs_reports_duplicate_people(self):
+        User(username='jdoe', first_name='John', last_name='Doe',
+             email='john@example.org').save()
+        output, errors = self.import_csv()
+        self.assertRegexpMatches(errors.getvalue(),
+                                 r'John Doe in row 3 .* may be a duplicate '
+                                 r'of user "jdoe" \(similar name\)')
+
+    def test_unparseable_rows_are_skipped(self):
+        command = importorgs.Command()
+        command.city = self.wnyc.city
+        info = dict((field, '') for field in importorgs.CONTACT_FIELDS)
+        info.update({
+            'row': 3,
+            'name-of-organization': 'Museum of Cher',
+            'contact-1': 'Cher\nSinger\ncher@example.org',
+        })
+        self.assertEqual(command.find_duplicates([info]), [])
@@ -0,0 +1,40 @@
+import doctest
+import StringIO
+from mock import patch
+from django.core.management import call_command
+
+from directory import markup
+from directory.models import Organization
+from .test_views import WnycTestCase
+
+def load_tests(loader, tests, ignore):
+    tests.addTests(doctest.DocTestSuite(markup))
+    return tests
+
+class StoredHtmlTests(WnycTestCase):
+    def test_html_is_rendered_on_save(self):
+        self.wnyc.mission = u'*hi*'
+        self.wnyc.save()
+        wnyc = Organization.objects.get(slug='wnyc')
+        self.assertEqual(wnyc.mission_html, u'<p><em>hi</em></p>')
+        self.assertEqual(self.wnyc_member.membership.bio_html, u'')
+
+    def test_stored_html_is_used_when_current(self):
+        with patch.object(markup, 'render') as render:
+            self.assertEqual(self.wnyc.rendered_mission,
+                             self.wnyc.mission_html)
+            self.assertFalse(render.called)
+
+    def test_html_is_rendered_when_stale(self):
+        Organization.objects.filter(slug='wnyc').update(mission=u'*new*')
+        wnyc = Organization.objects.get(slug='wnyc')
+        self.assertEqual(wnyc.rendered_mission, u'<p><em>new</em></p>')
+
+    def test_rendermarkdown_updates_stale_html(self):
+        Organization.objects.filter(slug='wnyc').update(mission=u'*new*')
+        output = StringIO.StringIO()
+        call_command('rendermarkdown', stdout=output)
+        self.assertRegexpMatches(output.getvalue(), '1 mission')
+        wnyc = Organization.objects.get(slug='wnyc')
+        self.assertEqual(wnyc.mission_html, u'<p><em>new</em></p>')
+        self.assertEqual(wnyc.mission_html_key, markup.get_key(u'*new*'))
@@ -1,14 +1,22 @@
+import doctest
+import StringIO
 from django.test import TestCase
+from django.core.management import call_command
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
 
 from .test_views import WnycTestCase
 from .test_multi_city import using_multi_city_site
+from .. import models
 from ..models import Organization, ContentChannel, Expertise, City, \
                      Membership
 from ..management.commands.seeddata import create_user
 
+def load_tests(loader, tests, ignore):
+    tests.addTests(doctest.DocTestSuite(models))
+    return tests
+
 class MembershipTests(TestCase):
     fixtures = ['wnyc.json']
 
@@ -19,6 +27,30 @@ class MembershipTests(TestCase):
         self.assertTrue(user.membership.is_listed)
         self.assertFalse(user.membership.organization)
 
+    def test_email_hash_is_set_on_creation(self):
+        user = User(username='foo', email=' MyEmailAddress@example.com')
+        user.save()
+        self.assertEqual(user.membership.email_hash,
+                         '0bc83cb571cd1c50ba6f3e8a78ef1346')
+
+    def test_email_hash_is_updated_when_email_changes(self):
+        user = User(username='foo', email='foo@example.com')
+        user.save()
+        user.email = 'MyEmailAddress@example.com'
+        user.save()
+        self.assertEqual(Membership.objects.get(user=user).email_hash,
+                         '0bc83cb571cd1c50ba6f3e8a78ef1346')
+
+    def test_rebuildemailhashes_fixes_stale_hashes(self):
+        user = User(username='foo', email='MyEmailAddress@example.com')
+        user.save()
+        Membership.objects.filter(user=user).update(email_hash='')
+        output = StringIO.StringIO()
+        call_command('rebuildemailhashes', stdout=output)
+        self.assertRegexpMatches(output.getvalue(), 'Updated 1 ')
+        self.assertEqual(Membership.objects.get(user=user).email_hash,
+                         '0bc83cb571cd1c50ba6f3e8a78ef1346')
+
     def test_city_is_none_when_org_is_none(self):
         m = Membership()
         self.assertEqual(m.city, None)
@@ -56,6 +88,54 @@ class OrganizationTests(TestCase):
             wnyc.full_clean
         )
 
+class MembershipDirectoryTests(WnycTestCase):
+    def setUp(self):
+        super(MembershipDirectoryTests, self).setUp()
+        for name in ['Zed', 'Adams', 'Moss']:
+            create_user(name.lower(), last_name=name, organization=self.wnyc)
+        unlisted = create_user('unlisted', last_name='Aaron',
+                               organization=self.wnyc)
+        unlisted.membership.is_listed = False
+        unlisted.membership.save()
+
+    def last_names(self, memberships):
+        return [membership.user.last_name for membership in memberships]
+
+    def test_listed_memberships_are_ordered_by_last_name(self):
+        self.assertEqual(self.last_names(self.wnyc.memberships.listed()),
+                         ['Adams', 'Lehrer', 'Moss', 'Zed'])
+
+    def test_membership_directory_lists_all_listed_members(self):
+        self.assertEqual(self.last_names(self.wnyc.membership_directory()),
+                         ['Adams', 'Lehrer', 'Moss', 'Zed'])
+
+class PossibleAffiliationsTests(WnycTestCase):
+    def affiliations(self, email):
+        user = User(username='foo', email=email)
+        return [org.slug for org in
+                Organization.objects.possible_affiliations_for(user)]
+
+    def test_exact_domains_match(self):
+        self.assertEqual(self.affiliations('foo@WNYC.org'), ['wnyc'])
+
+    def test_subdomains_match(self):
+        self.assertEqual(self.affiliations('foo@news.wnyc.org'), ['wnyc'])
+
+    def test_most_specific_domain_wins(self):
+        Organization(name='WNYC News', slug='news', city=self.wnyc.city,
+                     email_domain='news.wnyc.org').save()
+        self.assertEqual(self.affiliations('foo@news.wnyc.org'), ['news'])
+        self.assertEqual(self.affiliations('foo@wnyc.org'), ['wnyc'])
+
+    def test_unrelated_domains_do_not_match(self):
+        self.assertEqual(self.affiliations('foo@notwnyc.org'), [])
+        self.assertEqual(self.affiliations('foo'), [])
+
+    def test_changed_domains_are_reindexed(self):
+        self.wnyc.email_domain = 'wnycstudios.org'
+        self.wnyc.save()
+        self.assertEqual(self.affiliations('foo@wnyc.org'), [])
+
 class ContentChannelManagerTests(WnycTestCase):
     def assertCats(self, channels, cats):
         self.assertEqual([channel.category for channel in channels], cats)
@@ -72,6 +152,18 @@ class ContentChannelManagerTests(WnycTestCase):
         self.assertCats(self.wnyc.content_channels.unique_with_icons(),
                         ['facebook'])
 
+    def test_unique_with_icons_prefers_earliest_modified(self):
+        ContentChannel(category='flickr', url='http://flickr.com/a',
+                       organization=self.wnyc).save()
+        first = self.wnyc.content_channels.get(category='facebook')
+        first.url = 'http://facebook.com/b'
+        first.save()
+        ContentChannel(category='facebook', url='http://facebook.com/c',
+                       organization=self.wnyc).save()
+        self.assertEqual([channel.url for channel in
+                          self.wnyc.content_channels.unique_with_icons()],
+                         ['http://flickr.com/a', 'http://facebook.com/b'])
+
 class ContentChannelTests(TestCase):
     def test_fa_icon_returns_empty_string_if_none_available(self):
         c = ContentChannel(category='other')
@@ -101,6 +193,31 @@ class CityTests(TestCase):
     def test_shortest_name_falls_back_to_name(self):
         self.assertEqual(City(name='Chicago').shortest_name, 'Chicago')
 
+class CityDirectoryCountsTests(WnycTestCase):
+    def get_counts(self):
+        return dict((city.slug, (city.num_orgs, city.num_members))
+                    for city in City.objects.with_directory_counts())
+
+    def test_counts_active_orgs_and_listed_members(self):
+        self.assertEqual(self.get_counts(), {'nyc': (1, 1)})
+
+    def test_ignores_inactive_orgs_and_their_members(self):
+        self.wnyc.is_active = False
+        self.wnyc.save()
+        self.assertEqual(self.get_counts(), {'nyc': (0, 0)})
+
+    def test_ignores_unlisted_and_inactive_members(self):
+        unlisted = create_user('unlisted', organization=self.wnyc)
+        unlisted.membership.is_listed = False
+        unlisted.membership.save()
+        self.wnyc_member.is_active = False
+        self.wnyc_member.save()
+        self.assertEqual(self.get_counts(), {'nyc': (1, 0)})
+
+    def test_includes_cities_without_orgs(self):
+        City(name='Chicago', slug='chicago').save()
+        self.assertEqual(self.get_counts()['chicago'], (0, 0))
+
 class CityShouldBeMentionedTests(TestCase):
     fixtures = ['wnyc.json']
     
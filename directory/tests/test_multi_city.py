@@ -1,8 +1,11 @@
-from django.test import TestCase
+from mock import patch
+from django.test import TestCase, RequestFactory
 from django.contrib.sites.models import Site
 from django.test.utils import override_settings
+from django.core.urlresolvers import resolve, NoReverseMatch
 
-from ..multi_city import is_multi_city
+from ..models import get_current_city
+from ..multi_city import is_multi_city, city_reverse, get_city_urls
 
 def using_multi_city_site(f):
     def wrapper(self):
@@ -22,6 +25,27 @@ class IsMultiCityTests(TestCase):
     def test_returns_false_when_city_exists(self):
         self.assertFalse(is_multi_city())
 
+class GetCurrentCityTests(TestCase):
+    fixtures = ['wnyc.json']
+
+    def test_city_is_only_looked_up_once_per_worker(self):
+        get_current_city()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_current_city().slug, 'nyc')
+
+    def test_city_is_remembered_on_request(self):
+        request = RequestFactory().get('/')
+        city = get_current_city(request)
+        with patch('directory.models.site_cities') as site_cities:
+            self.assertEqual(get_current_city(request), city)
+            self.assertFalse(site_cities.get.called)
+
+    def test_city_is_looked_up_again_when_cities_change(self):
+        city = get_current_city()
+        city.site = None
+        city.save()
+        self.assertEqual(get_current_city(), None)
+
 class CityScopedTests(TestCase):
     fixtures = ['wnyc.json', 'chicago.json']
 
@@ -47,3 +71,38 @@ class CityScopedTests(TestCase):
     def test_multi_city_sites_ignore_single_city_urls(self):
         response = self.client.get('/activity/')
         self.assertEqual(response.status_code, 404)
+
+class CityReverseTests(TestCase):
+    fixtures = ['wnyc.json', 'chicago.json']
+
+    def make_request(self, path):
+        request = RequestFactory().get(path)
+        request.resolver_match = resolve(path)
+        return request
+
+    def test_single_city_sites_get_implicit_city_urls(self):
+        request = self.make_request('/')
+        self.assertEqual(city_reverse(request, 'activity'), '/activity/')
+
+    @using_multi_city_site
+    def test_multi_city_sites_get_explicit_city_urls(self):
+        request = self.make_request('/chicago/')
+        self.assertEqual(city_reverse(request, 'activity'),
+                         '/chicago/activity/')
+
+    def test_every_city_scoped_view_is_included(self):
+        self.assertEqual(get_city_urls()['members_widget_js'],
+                         '/widgets/members.js')
+        self.assertEqual(get_city_urls('chicago')['find_json'],
+                         '/chicago/find.json')
+
+    def test_unknown_view_names_raise_no_reverse_match(self):
+        request = self.make_request('/')
+        self.assertRaises(NoReverseMatch, city_reverse, request, 'blarg')
+
+    def test_urls_are_only_reversed_once_per_worker(self):
+        request = self.make_request('/')
+        city_reverse(request, 'home')
+        with patch('directory.multi_city.reverse') as reverse:
+            self.assertEqual(city_reverse(request, 'search'), '/search/')
+            self.assertFalse(reverse.called)
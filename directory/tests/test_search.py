@@ -0,0 +1,160 @@
+import doctest
+import StringIO
+from unittest import skipUnless
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
+from django.test.utils import override_settings
+
+from directory import search, search_backends
+from directory.models import Organization, OrganizationMembershipType, \
+                             SearchEntry, SearchDocument
+from directory.search_backends import SearchEntryBackend, \
+                                      SqliteSearchBackend, \
+                                      PostgresSearchBackend
+from .test_views import WnycTestCase
+
+def load_tests(loader, tests, ignore):
+    tests.addTests(doctest.DocTestSuite(search))
+    tests.addTests(doctest.DocTestSuite(search_backends))
+    return tests
+
+class SearchIndexTests(object):
+    def setUp(self):
+        super(SearchIndexTests, self).setUp()
+        search.rebuild_index()
+
+    def test_backend_is_available(self):
+        self.assertEqual(search.get_backend().__class__, self.backend)
+
+    def search(self, query, include_people=True):
+        return search.search(query, city=self.wnyc.city,
+                             include_people=include_people)
+
+    def test_orgs_are_indexed_when_saved(self):
+        self.assertEqual(self.search('radio')[0], [self.wnyc])
+        self.wnyc.name = 'Public Broadcasting'
+        self.wnyc.mission = ''
+        self.wnyc.save()
+        self.assertEqual(self.search('radio')[0], [])
+        self.assertEqual(self.search('broadcast')[0], [self.wnyc])
+
+    def test_inactive_orgs_are_removed_from_index(self):
+        self.wnyc.is_active = False
+        self.wnyc.save()
+        self.assertEqual(self.search('rookies')[0], [])
+
+    def test_memberships_are_indexed_when_user_changes(self):
+        self.assertEqual(self.search('lehrer')[1],
+                         [self.wnyc_member.membership])
+        self.wnyc_member.last_name = 'Gladstone'
+        self.wnyc_member.save()
+        self.assertEqual(self.search('lehrer')[1], [])
+        self.assertEqual(self.search('gladstone')[1],
+                         [self.wnyc_member.membership])
+
+    def test_unlisted_memberships_are_not_indexed(self):
+        self.wnyc_member.membership.is_listed = False
+        self.wnyc_member.membership.save()
+        self.assertEqual(self.search('lehrer')[1], [])
+
+    def test_people_are_excluded_unless_requested(self):
+        self.assertEqual(self.search('lehrer', include_people=False),
+                         ([], []))
+
+    def test_membership_types_are_indexed_when_added(self):
+        orgtype = OrganizationMembershipType(name='Partner',
+                                             city=self.wnyc.city)
+        orgtype.save()
+        self.assertEqual(self.search('partner')[0], [])
+        self.wnyc.membership_types.add(orgtype)
+        self.assertEqual(self.search('partner')[0], [self.wnyc])
+
+    def test_all_query_tokens_must_match(self):
+        self.assertEqual(self.search('radio rook')[0], [self.wnyc])
+        self.assertEqual(self.search('radio blarg')[0], [])
+
+    def test_name_hits_rank_above_mission_hits(self):
+        Organization(name='Teenagers Unite', slug='teens',
+                     website='http://example.org/',
+                     city=self.wnyc.city).save()
+        orgs = self.search('teenagers')[0]
+        self.assertEqual([org.slug for org in orgs], ['teens', 'wnyc'])
+
+    def test_ranking_is_counted_and_sliced_by_the_backend(self):
+        teens = Organization(name='Teenagers Unite', slug='teens',
+                             website='http://example.org/',
+                             city=self.wnyc.city)
+        teens.save()
+        ranking = search.Ranking('teenagers', city=self.wnyc.city)
+        self.assertEqual(ranking.count(), 2)
+        self.assertEqual(ranking[1:5], [(self.wnyc.id, None)])
+        self.assertEqual(ranking[:1], [(teens.id, None)])
+        self.assertEqual(search.Ranking('', city=self.wnyc.city).count(), 0)
+
+    def test_search_page_only_fetches_its_page(self):
+        Organization(name='Teenagers Unite', slug='teens',
+                     website='http://example.org/',
+                     city=self.wnyc.city).save()
+        page = search.search_page('teenagers', 2, city=self.wnyc.city,
+                                  per_page=1)
+        self.assertEqual(page.paginator.count, 2)
+        self.assertEqual(page.object_list, ([self.wnyc], []))
+
+    def test_raw_saves_are_not_indexed(self):
+        org = Organization(name='Fixture Org', slug='fixture',
+                           website='http://example.org/',
+                           city=self.wnyc.city, created=timezone.now(),
+                           modified=timezone.now())
+        org.save_base(raw=True)
+        self.assertEqual(self.search('fixture')[0], [])
+
+    def test_prefixes_match_longer_tokens_only(self):
+        self.assertEqual(self.search('rook')[0], [self.wnyc])
+        self.assertEqual(self.search('rookiesz')[0], [])
+
+    def test_rebuildsearchindex_works(self):
+        search.get_backend().clear()
+        self.assertEqual(self.search('rookies')[0], [])
+        call_command('rebuildsearchindex', stdout=StringIO.StringIO())
+        self.assertEqual(self.search('rookies')[0], [self.wnyc])
+        self.assertEqual(self.search('brian')[1],
+                         [self.wnyc_member.membership])
+
+@override_settings(
+    SEARCH_BACKEND='directory.search_backends.SearchEntryBackend'
+)
+class SearchEntryBackendTests(SearchIndexTests, WnycTestCase):
+    backend = SearchEntryBackend
+
+    def test_entries_are_stored(self):
+        self.assertTrue(SearchEntry.objects.filter(token='rookies'))
+
+    @skipUnless(connection.vendor == 'sqlite', 'requires SQLite')
+    def test_prefixes_are_looked_up_in_the_index(self):
+        entries = SearchEntryBackend().matching_entries(
+            ['rad', 'roo'], self.wnyc.city, True
+        )
+        sql, params = entries.query.sql_with_params()
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('city_id=? AND token>? AND token<?', plan)
+
+@skipUnless(connection.vendor == 'sqlite', 'requires SQLite')
+@override_settings(
+    SEARCH_BACKEND='directory.search_backends.SqliteSearchBackend'
+)
+class SqliteSearchBackendTests(SearchIndexTests, WnycTestCase):
+    backend = SqliteSearchBackend
+
+    def test_documents_are_stored(self):
+        self.assertEqual(SearchDocument.objects.get(organization=self.wnyc)
+                         .name, "WNYC's Radio Rookies")
+
+@skipUnless(connection.vendor == 'postgresql', 'requires Postgres')
+@override_settings(
+    SEARCH_BACKEND='directory.search_backends.PostgresSearchBackend'
+)
+class PostgresSearchBackendTests(SearchIndexTests, WnycTestCase):
+    backend = PostgresSearchBackend
@@ -0,0 +1,73 @@
+import doctest
+from mock import patch
+from django.test.utils import override_settings
+
+from directory import snapshot
+from directory.snapshot import get_snapshot
+from .test_views import WnycTestCase
+
+def load_tests(loader, tests, ignore):
+    tests.addTests(doctest.DocTestSuite(snapshot))
+    return tests
+
+class FakeThread(object):
+    started = []
+
+    def __init__(self, target, args):
+        self.target = target
+        self.args = args
+
+    def start(self):
+        self.started.append(self)
+
+    def run(self):
+        self.target(*self.args)
+
+class SnapshotTests(WnycTestCase):
+    def test_includes_active_orgs_and_listed_members(self):
+        org = get_snapshot(self.wnyc.city).orgs_by_slug['wnyc']
+        self.assertEqual(org.name, self.wnyc.name)
+        self.assertEqual([membership.user.get_full_name()
+                          for membership in org.memberships],
+                         ['Brian Lehrer'])
+        self.wnyc.is_active = False
+        self.wnyc.save()
+        self.assertEqual(get_snapshot(self.wnyc.city).orgs, ())
+
+    def test_is_immutable(self):
+        org = get_snapshot(self.wnyc.city).orgs[0]
+        with self.assertRaises(AttributeError):
+            org.name = 'Changed'
+
+    def test_public_pages_do_not_query_database_when_warm(self):
+        urls = ['/', '/orgs/wnyc/', '/widgets/members/',
+                '/find.json?query=radio', '/api/v1/cities/nyc/members']
+        for url in urls:
+            self.client.get(url)
+        with self.assertNumQueries(0):
+            for url in urls:
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_inactive_orgs_are_not_found(self):
+        self.wnyc.is_active = False
+        self.wnyc.save()
+        self.assertEqual(self.client.get('/orgs/wnyc/').status_code, 404)
+
+    @override_settings(DIRECTORY_SNAPSHOT_BACKGROUND_REBUILDS=True)
+    def test_previous_snapshot_is_served_while_rebuilding(self):
+        city = self.wnyc.city
+        # Forget snapshots of other tests' data, so the first one is
+        # built right away.
+        snapshot.snapshots.snapshots.clear()
+        FakeThread.started = []
+        with patch('directory.snapshot.threading.Thread', FakeThread):
+            get_snapshot(city)
+            self.wnyc.name = 'Public Radio'
+            self.wnyc.save()
+            self.assertEqual(get_snapshot(city).orgs[0].name,
+                             "WNYC's Radio Rookies")
+            get_snapshot(city)
+        self.assertEqual(len(FakeThread.started), 1)
+        with patch('directory.snapshot.connection'):
+            FakeThread.started[0].run()
+        self.assertEqual(get_snapshot(city).orgs[0].name, 'Public Radio')
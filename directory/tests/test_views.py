@@ -1,12 +1,16 @@
 import json
+from mock import patch
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.contrib.auth.models import User, Permission
 from django.core import mail
 from django.core.urlresolvers import reverse
 from registration.models import RegistrationProfile
 
 from .test_multi_city import using_multi_city_site
-from ..models import Organization
+from ..models import Organization, City, Membership, ActivityEvent
+from .. import search
 from ..management.commands.seeddata import create_user
 
 get_org = lambda slug: Organization.objects.get(slug=slug)
@@ -81,6 +85,11 @@ class OrganizationMembershipTypeTests(WnycAndAmnhTestCase):
         self.assertNotContains(response, 'wnyc')
 
 class SearchTests(WnycTestCase):
+    def setUp(self):
+        super(SearchTests, self).setUp()
+        # Fixtures are loaded with raw saves, which aren't indexed.
+        search.rebuild_index()
+
     def query(self, query, ignore_last_result=True):
         return self.client.get('/search/', {'query': query})
 
@@ -106,6 +115,67 @@ class SearchTests(WnycTestCase):
         response = self.query('lehrer')
         self.assertContains(response, 'Brian Lehrer')
 
+    def test_results_include_highlighted_snippets(self):
+        response = self.query('teenagers')
+        self.assertContains(response, 'provides <mark>teenagers</mark> '
+                                      'with the tools')
+
+    def test_results_are_paginated(self):
+        Organization(name='Radio Pioneers', slug='pioneers',
+                     website='http://example.org/',
+                     city=self.wnyc.city).save()
+        with patch('directory.search.RESULTS_PER_PAGE', 1):
+            response = self.query('radio')
+            self.assertContains(response, 'Radio Pioneers')
+            self.assertNotContains(response, 'Radio Rookies')
+            self.assertContains(response, 'page=2')
+            response = self.client.get('/search/', {'query': 'radio',
+                                                    'page': '2'})
+            self.assertNotContains(response, 'Radio Pioneers')
+            self.assertContains(response, 'Radio Rookies')
+
+    def test_empty_pages_redirect_to_first_page(self):
+        response = self.client.get('/search/', {'query': 'radio',
+                                                'page': '99'})
+        self.assertRedirects(response, '/search/?query=radio')
+
+    def test_misspelled_queries_suggest_close_matches(self):
+        response = self.query('rokies')
+        self.assertContains(response, "no results matched your query")
+        self.assertContains(response, "Did you mean")
+        self.assertContains(response, "Radio Rookies")
+
+class SearchAllTests(WnycTestCase):
+    def setUp(self):
+        super(SearchAllTests, self).setUp()
+        search.rebuild_index()
+        chicago = City(name='Chicago', slug='chicago')
+        chicago.save()
+        Organization(name='Chicago Public Radio', slug='cpr',
+                     website='http://example.org/', city=chicago).save()
+
+    @using_multi_city_site
+    def test_results_are_grouped_by_city(self):
+        response = self.client.get('/search/?query=radio')
+        self.assertEqual(sorted([
+            (city.name, [org.slug for org in orgs])
+            for city, orgs, memberships in response.context['groups']
+        ]), [('Chicago', ['cpr']), ('New York City', ['wnyc'])])
+        self.assertContains(response, 'href="/chicago/"')
+
+    @using_multi_city_site
+    def test_people_are_shown_to_privileged_users(self):
+        response = self.client.get('/search/?query=brian')
+        self.assertTrue(response.context['no_results'])
+        self.login_as_wnyc_member()
+        response = self.client.get('/search/?query=brian')
+        self.assertContains(response, 'Brian Lehrer')
+
+    def test_single_city_sites_only_search_their_city(self):
+        response = self.client.get('/search/?query=radio')
+        self.assertContains(response, 'Radio Rookies')
+        self.assertNotContains(response, 'Chicago Public Radio')
+
 class FindJsonTests(WnycTestCase):
     def query(self, query, ignore_last_result=True):
         response = self.client.get('/find.json', {'query': query})
@@ -146,6 +216,14 @@ class FindJsonTests(WnycTestCase):
             'value': 'Brian Lehrer'
         }])
 
+    def test_misspelled_queries_return_close_matches(self):
+        self.login_as_wnyc_member()
+        response = self.query('brain lerher')
+        self.assertEqual(response.json, [{
+            'url': '/users/wnyc_member/',
+            'value': 'Brian Lehrer'
+        }])
+
 class UserDetailTests(WnycTestCase):
     def test_nonmembers_are_redirected(self):
         self.assertNonMembersAreDenied('/users/wnyc_member/')
@@ -171,6 +249,81 @@ class ActivityTests(WnycTestCase):
     def test_redirects_nonmembers_to_login(self):
         self.assertNonMembersAreDenied('/activity/')
 
+    def test_shows_new_members(self):
+        self.login_as_wnyc_member()
+        response = self.client.get('/activity/')
+        self.assertContains(response, '>wnyc_member</a> joined')
+
+    def test_shows_org_edits(self):
+        self.login_as_wnyc_member()
+        self.wnyc.website = 'http://wnyc.org/rookies/'
+        self.wnyc.save()
+        response = self.client.get('/activity/')
+        self.assertContains(response, 'Radio Rookies</a> was updated')
+
+    def test_unchanged_orgs_are_not_recorded(self):
+        org = Organization.objects.get(slug='wnyc')
+        events = ActivityEvent.objects.count()
+        org.save()
+        self.assertEqual(ActivityEvent.objects.count(), events)
+
+    def test_channel_deletions_are_recorded(self):
+        channel = self.wnyc.content_channels.create(
+            category='facebook', url='http://facebook.com/wnyc'
+        )
+        ActivityEvent.objects.all().delete()
+        channel.delete()
+        self.assertEqual([event.kind for event in
+                          ActivityEvent.objects.all()], ['channel_changed'])
+
+    def test_channels_of_deleted_orgs_are_not_recorded(self):
+        self.wnyc.content_channels.create(category='facebook',
+                                          url='http://facebook.com/wnyc')
+        ActivityEvent.objects.all().delete()
+        self.wnyc.delete()
+        self.assertEqual(ActivityEvent.objects.count(), 0)
+
+    def test_shows_profile_edits(self):
+        self.login_as_wnyc_member()
+        membership = self.wnyc_member.membership
+        membership.title = 'Host'
+        membership.save()
+        response = self.client.get('/activity/')
+        self.assertContains(response, 'wnyc_member</a> updated their profile')
+
+    def test_unchanged_profiles_are_not_recorded(self):
+        membership = Membership.objects.get(user=self.wnyc_member)
+        events = ActivityEvent.objects.count()
+        membership.save()
+        self.assertEqual(ActivityEvent.objects.count(), events)
+
+    def test_events_outlive_deleted_orgs(self):
+        self.login_as_wnyc_member()
+        org = Organization(name='Gone Radio', slug='gone',
+                           website='http://example.org/',
+                           city=self.wnyc.city)
+        org.save()
+        org.delete()
+        response = self.client.get('/activity.json')
+        events = json.loads(response.content)
+        self.assertEqual(events[0]['description'],
+                         'Gone Radio was added to the directory')
+        self.assertEqual(events[0]['url'], None)
+
+    def test_json_feed_lists_newest_events_first(self):
+        self.login_as_wnyc_member()
+        self.wnyc.content_channels.create(category='facebook',
+                                          url='http://facebook.com/wnyc')
+        response = self.client.get('/activity.json')
+        events = json.loads(response.content)
+        self.assertEqual(events[0]['kind'], 'channel_changed')
+        self.assertEqual(events[0]['url'], '/orgs/wnyc/')
+        self.assertEqual(events[1]['kind'], 'member_joined')
+        self.assertEqual(events[1]['description'], 'wnyc_member joined')
+
+    def test_json_feed_redirects_nonmembers_to_login(self):
+        self.assertNonMembersAreDenied('/activity.json')
+
 class UserEditTests(WnycTestCase):
     BASE_FORM = {
         'expertise-TOTAL_FORMS': '3',
@@ -226,6 +379,25 @@ class OrganizationDetailTests(WnycTestCase):
         response = self.client.get('/orgs/wnyc/')
         self.assertContains(response, 'Lehrer')
 
+    def test_people_are_paginated(self):
+        create_user('zed', last_name='Zed', organization=self.wnyc)
+        self.login_as_wnyc_member()
+        with patch('directory.views.MEMBERS_PER_PAGE', 1):
+            response = self.client.get('/orgs/wnyc/')
+            self.assertContains(response, 'Lehrer')
+            self.assertNotContains(response, 'Zed')
+            self.assertContains(response, '?page=2')
+            response = self.client.get('/orgs/wnyc/', {'page': '2'})
+            self.assertNotContains(response, 'Lehrer')
+            self.assertContains(response, 'Zed')
+
+    def test_listings_link_to_all_people(self):
+        self.login_as_wnyc_member()
+        with patch.object(Organization, 'MEMBERSHIP_DIRECTORY_PREVIEW', 0):
+            response = self.client.get('/')
+        self.assertNotContains(response, 'Lehrer')
+        self.assertContains(response, 'See all members')
+
 class OrganizationEditTests(WnycAndAmnhTestCase):
     BASE_FORM = {
         'chan-TOTAL_FORMS': '3',
@@ -279,6 +451,21 @@ class HomePageTests(WnycTestCase):
         self.assertContains(response, 'New York City')
         self.assertNotContains(response, 'Radio Rookies')
 
+    @using_multi_city_site
+    def test_multi_city_homepage_shows_city_counts(self):
+        response = self.client.get('/')
+        self.assertContains(response, '1 organization &middot; 1 member')
+
+    @using_multi_city_site
+    def test_multi_city_homepage_counts_are_cached(self):
+        self.client.get('/')
+        City(name='Chicago', slug='chicago').save()
+        response = self.client.get('/')
+        self.assertContains(response, 'Chicago')
+        self.assertContains(response, '0 organizations')
+        with self.assertNumQueries(0):
+            self.client.get('/')
+
     def test_directory_listing_shows_orgs(self):
         response = self.client.get('/')
         self.assertContains(response, 'Radio Rookies')
@@ -288,6 +475,26 @@ class HomePageTests(WnycTestCase):
         response = self.client.get('/')
         self.assertContains(response, 'member@wnyc.org')
 
+    def count_home_page_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/').status_code, 200)
+        return len(queries)
+
+    def test_directory_listing_queries_do_not_grow_with_orgs(self):
+        self.login_as_wnyc_member()
+        self.client.get('/')
+        num_queries = self.count_home_page_queries()
+        for i in range(3):
+            org = Organization(name='Org %d' % i, slug='org%d' % i,
+                               website='http://example.org/',
+                               city=self.wnyc.city)
+            org.save()
+            org.content_channels.create(category='facebook',
+                                        url='http://facebook.com/%d' % i)
+            create_user('member%d' % i, organization=org)
+        self.client.get('/')
+        self.assertEqual(self.count_home_page_queries(), num_queries)
+
     def test_directory_listing_hides_emails_from_nonmembers(self):
         self.login_as_non_member()
         response = self.client.get('/')
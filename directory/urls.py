@@ -11,6 +11,8 @@ def city_scoped_directory_patterns(is_multi_city_site):
         url(r'^find.json$', views.city_find_json, name=prefix + 'find_json'),
         url(r'^search/$', views.city_search, name=prefix + 'search'),
         url(r'^activity/$', views.city_activity, name=prefix + 'activity'),
+        url(r'^activity.json$', views.city_activity_json,
+            name=prefix + 'activity_json'),
         url(r'^importorgs/$', views.city_importorgs,
             name=prefix + 'importorgs'),
         url(r'^widgets/$', views.city_widgets, name=prefix + 'widgets'),
@@ -22,6 +24,7 @@ def city_scoped_directory_patterns(is_multi_city_site):
 
 urlpatterns = patterns('',
     url(r'^$', views.home, name='home'),
+    url(r'^search/$', views.search_all, name='search_all'),
     url(r'^orgs/(?P<organization_slug>[A-Za-z0-9_\-]+)/$',
         views.organization_detail, name='organization_detail'),
     url(r'^orgs/(?P<organization_slug>[A-Za-z0-9_\-]+)/edit/$',
@@ -1,21 +1,24 @@
 import json
 from django.shortcuts import render, redirect, get_object_or_404
 from django.http import HttpResponse, HttpResponseForbidden, \
-                        HttpResponseBadRequest
+                        HttpResponseBadRequest, Http404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, \
-                                           user_passes_test, \
                                            permission_required
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.core.urlresolvers import reverse
+from django.core.cache import cache
 from django.utils.http import urlencode
-from django.db.models import Q
 from django.views.decorators.clickjacking import xframe_options_exempt
 
+from . import search, autocomplete, fuzzy, facets
+from .auth import RequestPrivileges, privileges_required
+from .data_version import get_version
+from .snapshot import get_snapshot, get_organization
 from .multi_city import city_scoped, city_reverse, is_multi_city
 from .models import Organization, Membership, City, is_user_vouched_for, \
-                    is_user_privileged, get_current_city, \
-                    OrganizationMembershipType
+                    get_current_city, OrganizationMembershipType, \
+                    ActivityEvent
 from .forms import ExpertiseFormSet, ExpertiseFormSetHelper, \
                    ContentChannelFormSet, ChannelFormSetHelper, \
                    MembershipForm, UserProfileForm, OrganizationForm, \
@@ -23,9 +26,15 @@ from .forms import ExpertiseFormSet, ExpertiseFormSetHelper, \
 
 ORGS_PER_PAGE = 5
 
+ACTIVITY_EVENTS = 10
+
+MEMBERS_PER_PAGE = 20
+
 def is_request_privileged(request):
-    return (request.user.is_authenticated() and
-            is_user_privileged(request.user))
+    privileges = getattr(request, 'privileges', None)
+    if privileges is None:
+        privileges = RequestPrivileges(request.user)
+    return privileges.is_privileged
 
 def validate_and_save_forms(*forms):
     forms = [form for form in forms if form is not None]
@@ -34,10 +43,23 @@ def validate_and_save_forms(*forms):
     for form in forms: form.save()
     return True
 
+def get_city_summaries():
+    '''
+    Returns City.objects.with_directory_counts(), ordered by name and
+    cached until directory data changes.
+    '''
+
+    key = 'directory_city_summaries:%s' % get_version()
+    cities = cache.get(key)
+    if cities is None:
+        cities = list(City.objects.with_directory_counts().order_by('name'))
+        cache.set(key, cities)
+    return cities
+
 def home(request):
     if is_multi_city(request):
         return render(request, 'directory/multi_city_home.html', {
-            'cities': City.objects.all().order_by('name')
+            'cities': get_city_summaries()
         })
     return city_home(request)
 
@@ -79,25 +101,73 @@ def city_importorgs(request, city):
             'city': city
         })
 
+def get_facet_selection(request, facet_index):
+    return facet_index.clean(dict(
+        (name, request.GET.getlist(name))
+        for name, _ in facet_index.FACETS
+    ))
+
+def selection_to_query(selected, ages=None):
+    pairs = [(name, key) for name, keys in sorted(selected.items())
+             for key in keys]
+    if ages is not None:
+        pairs.append(('ages', '%d-%d' % ages))
+    return urlencode(pairs)
+
+def facet_links(facet_list, selected, ages=None):
+    '''
+    Returns a list of (facet, [(value, query string)]) pairs, where
+    each query string toggles its value in the current selection.
+    Values that wouldn't match any organizations are omitted.
+    '''
+
+    links = []
+    for facet in facet_list:
+        values = []
+        for value in facet.values:
+            if not (value.count or value.selected):
+                continue
+            toggled = dict(selected)
+            keys = [key for key in selected.get(facet.name, ())
+                    if key != value.key]
+            if not value.selected:
+                keys.append(value.key)
+            toggled[facet.name] = keys
+            values.append((value, selection_to_query(toggled, ages)))
+        if values:
+            links.append((facet, values))
+    return links
+
 @city_scoped
 def city_home(request, city):
-    all_orgs = Organization.objects.filter(
-        is_active=True,
-        city=city
-    ).order_by('name')
-    paginator = Paginator(all_orgs, ORGS_PER_PAGE)
-
-    page = request.GET.get('page')
+    facet_index = facets.get_index(city)
+    selected = get_facet_selection(request, facet_index)
+    ages = facets.parse_age_range(request.GET.get('ages'))
     try:
-        orgs = paginator.page(page)
-    except PageNotAnInteger:
-        orgs = paginator.page(1)
-    except EmptyPage:
-        orgs = paginator.page(paginator.num_pages)
+        # Page numbers are still supported for old links.
+        offset = max(int(request.GET.get('page', 1)) - 1, 0) * ORGS_PER_PAGE
+    except ValueError:
+        offset = 0
+    orgs = facet_index.page(
+        facet_index.filter(selected, ages=ages),
+        ORGS_PER_PAGE,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        offset=offset
+    )
+    orgs_by_id = get_snapshot(city).orgs_by_id
+    orgs.object_list = [orgs_by_id[org_id] for org_id in orgs.object_list
+                        if org_id in orgs_by_id]
 
     return render(request, 'directory/home.html', {
         'orgs': orgs,
         'city': city,
+        'facets': facet_links(facet_index.describe(selected, ages=ages),
+                              selected, ages),
+        'selected_facets': [(name, key) for name, keys in selected.items()
+                            for key in keys],
+        'ages': ages,
+        'filter_query': selection_to_query(selected, ages),
         'show_privileged_info': is_request_privileged(request)
     })
 
@@ -106,32 +176,67 @@ def city_search(request, city):
     query = request.GET.get('query')
     if not query:
         return HttpResponseBadRequest('query must be non-empty')
-    orgs = Organization.objects.filter(
-        Q(name__icontains=query) |
-        Q(mission__icontains=query),
-        is_active=True,
-        city=city
-    )
-    memberships = None
-    if is_request_privileged(request):
-        memberships = Membership.objects.filter(
-            Q(user__first_name__icontains=query) |
-            Q(user__last_name__icontains=query) |
-            Q(title__icontains=query) |
-            Q(bio__icontains=query),
-            is_listed=True,
-            user__is_active=True,
-            organization__city=city
-        )
+    include_people = is_request_privileged(request)
+    results = search_page_or_redirect(request, query, city, include_people)
+    if isinstance(results, HttpResponse):
+        return results
+    orgs, memberships = results.object_list
+    if not include_people:
+        memberships = None
+    no_results = not orgs and not memberships
+    suggestions = None
+    if no_results:
+        suggestions = fuzzy.find(city, query, include_people)
 
     return render(request, 'directory/search.html', {
         'query': query,
         'city': city,
-        'no_results': not orgs and not memberships,
+        'results': results,
+        'no_results': no_results,
+        'suggestions': suggestions,
         'orgs': orgs,
         'memberships': memberships
     })
 
+def search_page_or_redirect(request, query, city, include_people):
+    '''
+    Returns the requested page of search results for the given query,
+    or a redirect to the first page if it doesn't exist.
+    '''
+
+    try:
+        return search.search_page(query, request.GET.get('page', 1),
+                                  city=city, include_people=include_people)
+    except PageNotAnInteger:
+        return search.search_page(query, 1, city=city,
+                                  include_people=include_people)
+    except EmptyPage:
+        return redirect('%s?%s' % (request.path, urlencode({
+            'query': query
+        })))
+
+def search_all(request):
+    if not is_multi_city(request):
+        return city_search(request)
+    query = request.GET.get('query')
+    if not query:
+        return HttpResponseBadRequest('query must be non-empty')
+    include_people = is_request_privileged(request)
+    results = search_page_or_redirect(request, query, None, include_people)
+    if isinstance(results, HttpResponse):
+        return results
+    orgs, memberships = results.object_list
+    if not include_people:
+        memberships = []
+
+    return render(request, 'directory/search_all.html', {
+        'query': query,
+        'results': results,
+        'no_results': not orgs and not memberships,
+        'groups': search.group_by_city(orgs, memberships),
+        'show_people': include_people
+    })
+
 @city_scoped
 def city_find_json(request, city):
     query = request.GET.get('query')
@@ -139,26 +244,11 @@ def city_find_json(request, city):
     if not query:
         return HttpResponseBadRequest('query must be non-empty')
 
-    orgs = Organization.objects.filter(name__icontains=query,
-                                       is_active=True, city=city)
-    results.extend([
-        {'value': org.name, 'url': org.get_absolute_url()}
-        for org in orgs
-    ])
-
-    if is_request_privileged(request):
-        memberships = Membership.objects.filter(
-            Q(user__first_name__icontains=query) |
-            Q(user__last_name__icontains=query),
-            is_listed=True,
-            user__is_active=True,
-            organization__city=city
-        )
-        results.extend([
-            {'value': membership.user.get_full_name(),
-             'url': membership.get_absolute_url()}
-            for membership in memberships
-        ])
+    include_people = is_request_privileged(request)
+    results.extend(autocomplete.find(city, query, include_people))
+    if not results:
+        # Maybe the query has a typo in it.
+        results.extend(fuzzy.find(city, query, include_people))
 
     results.append({
         'value': 'Search the website for "%s"' % query,
@@ -169,16 +259,29 @@ def city_find_json(request, city):
 
     return HttpResponse(json.dumps(results), content_type='application/json')
 
+def get_recent_activity(city):
+    return ActivityEvent.objects.filter(city=city).select_related(
+        'user', 'organization'
+    )[:ACTIVITY_EVENTS]
+
 @city_scoped
-@user_passes_test(is_user_privileged)
+@privileges_required
 def city_activity(request, city):
-    memberships = Membership.objects.filter(
-        organization__city=city
-    ).order_by('-modified')[:10]
     return render(request, 'directory/activity.html', {
-        'memberships': memberships
+        'events': get_recent_activity(city)
     })
 
+@city_scoped
+@privileges_required
+def city_activity_json(request, city):
+    events = [{
+        'kind': event.kind,
+        'description': unicode(event),
+        'url': event.subject and event.subject.get_absolute_url(),
+        'created': event.created.isoformat()
+    } for event in get_recent_activity(city)]
+    return HttpResponse(json.dumps(events), content_type='application/json')
+
 @city_scoped
 def city_widgets(request, city):
     return render(request, 'directory/widgets.html', {'city': city})
@@ -186,13 +289,8 @@ def city_widgets(request, city):
 @city_scoped
 @xframe_options_exempt
 def city_members_widget(request, city):
-    orgs = Organization.objects.filter(
-        is_active=True,
-        city=city
-    ).order_by('name')
-
     return render(request, 'directory/members_widget.html', {
-        'orgs': orgs
+        'orgs': get_snapshot(city).orgs
     })
 
 @city_scoped
@@ -201,11 +299,23 @@ def city_members_widget_js(request, city):
                   content_type='application/javascript')
 
 def organization_detail(request, organization_slug):
-    org = get_object_or_404(Organization, slug=organization_slug,
-                            is_active=True)
+    org = get_organization(organization_slug)
+    if org is None:
+        raise Http404
+    show_privileged_info = is_request_privileged(request)
+    memberships = None
+    if show_privileged_info:
+        paginator = Paginator(org.memberships, MEMBERS_PER_PAGE)
+        try:
+            memberships = paginator.page(request.GET.get('page'))
+        except PageNotAnInteger:
+            memberships = paginator.page(1)
+        except EmptyPage:
+            memberships = paginator.page(paginator.num_pages)
     return render(request, 'directory/organization_detail.html', {
         'org': org,
-        'show_privileged_info': is_request_privileged(request)
+        'memberships': memberships,
+        'show_privileged_info': show_privileged_info
     })
 
 @login_required
@@ -244,7 +354,7 @@ def organization_membership_type(request, id):
         'orgtype': orgtype
     })
 
-@user_passes_test(is_user_privileged)
+@privileges_required
 def user_detail(request, username):
     membership = get_object_or_404(Membership, user__username=username,
                                    user__is_active=True)
@@ -267,7 +377,7 @@ def user_apply(request):
         else:
             messages.error(request, 'Your submission had some problems.')
     else:
-        city = get_current_city()
+        city = get_current_city(request)
         form = UserApplicationForm(initial={'city': city and city.id})
     return render(request, 'directory/user_apply.html', {
         'form': form
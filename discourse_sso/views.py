@@ -6,9 +6,8 @@ from hashlib import sha256
 from django.conf import settings
 from django.http import HttpResponseRedirect, HttpResponseBadRequest
 from django.shortcuts import render
-from django.contrib.auth.decorators import user_passes_test
 
-from directory.models import is_user_privileged
+from directory.auth import privileges_required
 
 if hasattr(hmac, 'compare_digest'):
     compare_digest = hmac.compare_digest
@@ -58,7 +57,7 @@ def user_info_qs(user, nonce):
         'name': user_name.encode('utf8')
     }))
 
-@user_passes_test(is_user_privileged)
+@privileges_required
 def sso_endpoint(request):
     try:
         nonce = unpack_and_verify_payload(request.GET)['nonce']
@@ -7,7 +7,7 @@ from django.contrib.auth.decorators import user_passes_test, login_required
 
 def _switch_to(request, user):
     # http://stackoverflow.com/a/2787747
-    user.backend = 'django.contrib.auth.backends.ModelBackend'
+    user.backend = 'directory.auth.MembershipBackend'
     auth.login(request, user)
 
 @require_POST
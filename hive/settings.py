@@ -15,8 +15,8 @@ import urlparse
 import dj_database_url
 
 from .settings_utils import set_default_env, set_default_db, \
-                            parse_email_backend_url, \
-                            parse_secure_proxy_ssl_header, \
+                            parse_email_backend_url, parse_search_backend, \
+                            parse_cache_url, parse_secure_proxy_ssl_header, \
                             is_running_test_suite
 
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
@@ -32,6 +32,7 @@ if os.path.basename(sys.argv[0]) == 'manage.py' or 'DEBUG' in os.environ:
         PORT='8000',
         # TODO: Set ORIGIN to include any passed-in IP address.
         EMAIL_BACKEND_URL='console:',
+        CACHE_URL='locmem:',
     )
 
 if 'SECURE_PROXY_SSL_HEADER' in os.environ:
@@ -56,6 +57,8 @@ DEBUG = TEMPLATE_DEBUG = 'DEBUG' in os.environ
 PORT = int(os.environ['PORT'])
 DISCOURSE_SSO_SECRET = os.environ.get('DISCOURSE_SSO_SECRET')
 DISCOURSE_SSO_ORIGIN = os.environ.get('DISCOURSE_SSO_ORIGIN')
+DIRECTORY_SNAPSHOT_BACKGROUND_REBUILDS = \
+    'DIRECTORY_SNAPSHOT_BACKGROUND_REBUILDS' in os.environ
 
 if DEBUG: set_default_env(ORIGIN='http://localhost:%d' % PORT)
 
@@ -63,6 +66,10 @@ set_default_db('sqlite:///%s' % path('db.sqlite3'))
 
 globals().update(parse_email_backend_url(os.environ['EMAIL_BACKEND_URL']))
 
+# The directory's data version is kept in the cache, so this needs to
+# be shared between all worker processes; see directory.data_version.
+CACHES = parse_cache_url(os.environ['CACHE_URL'])
+
 ORIGIN = os.environ['ORIGIN']
 
 ALLOWED_HOSTS = [urlparse.urlparse(ORIGIN).hostname]
@@ -93,6 +100,7 @@ if DISCOURSE_SSO_SECRET or is_running_test_suite():
     INSTALLED_APPS += ('discourse_sso',)
 
 MIDDLEWARE_CLASSES = (
+    'directory.data_version.DataVersionMiddleware',
     'hive.ssl.RedirectToHttpsMiddleware',
     'hive.ssl.HstsMiddleware',
     'csp.middleware.CSPMiddleware',
@@ -100,6 +108,7 @@ MIDDLEWARE_CLASSES = (
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'directory.auth.PrivilegesMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 )
@@ -133,6 +142,8 @@ DATABASES = {
     'default': dj_database_url.config()
 }
 
+SEARCH_BACKEND = parse_search_backend(os.environ['DATABASE_URL'])
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.6/topics/i18n/
 
@@ -176,6 +187,13 @@ TEMPLATE_DIRS = (
 
 SITE_ID = int(os.environ.get('SITE_ID', '1'))
 
+AUTHENTICATION_BACKENDS = (
+    'directory.auth.MembershipBackend',
+    # Sessions that were started before MembershipBackend was added
+    # still refer to this backend.
+    'django.contrib.auth.backends.ModelBackend',
+)
+
 LOGIN_URL = 'login'
 
 LOGOUT_URL = 'logout'
@@ -38,6 +38,47 @@ def parse_email_backend_url(url):
         raise ValueError('unknown scheme for email backend url: %s' % url)
     return s
 
+def parse_cache_url(url):
+    info = urlparse.urlparse(url)
+    if info.scheme == 'locmem':
+        cache = {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    elif info.scheme == 'db':
+        cache = {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': info.netloc or info.path,
+        }
+    elif info.scheme == 'file':
+        cache = {
+            'BACKEND': 'django.core.cache.backends.filebased.'
+                       'FileBasedCache',
+            'LOCATION': info.path,
+        }
+    elif info.scheme == 'memcached':
+        cache = {
+            'BACKEND': 'django.core.cache.backends.memcached.'
+                       'MemcachedCache',
+            'LOCATION': info.netloc.split(','),
+        }
+    else:
+        raise ValueError('unknown scheme for cache url: %s' % url)
+    return {'default': cache}
+
+SEARCH_BACKENDS = {
+    'postgres': 'directory.search_backends.PostgresSearchBackend',
+    'postgresql': 'directory.search_backends.PostgresSearchBackend',
+    'pgsql': 'directory.search_backends.PostgresSearchBackend',
+    'postgis': 'directory.search_backends.PostgresSearchBackend',
+    'sqlite': 'directory.search_backends.SqliteSearchBackend',
+}
+
+DEFAULT_SEARCH_BACKEND = 'directory.search_backends.SearchEntryBackend'
+
+def parse_search_backend(database_url):
+    scheme = urlparse.urlparse(database_url).scheme
+    return SEARCH_BACKENDS.get(scheme, DEFAULT_SEARCH_BACKEND)
+
 def parse_secure_proxy_ssl_header(field):
     name, value = field.split(':')
     return ('HTTP_%s' % name.upper().replace('-', '_'), value.strip())
@@ -41,6 +41,11 @@ class UserSwitchingTests(TestCase):
         self.assertRedirects(response, '/')
         self.assertEqual(response.context['user'].username, 'joe')
 
+    def test_switched_users_are_loaded_by_membership_backend(self):
+        c, response = self.post('/admin/switch-user/joe', 'admin')
+        self.assertEqual(c.session['_auth_user_backend'],
+                         'directory.auth.MembershipBackend')
+
     def test_switching_back_to_superuser_works(self):
         c, response = self.post('/admin/switch-user/joe', 'admin')
         self.assertEqual(response.context['user'].username, 'joe')
@@ -4,6 +4,7 @@ from mock import patch
 
 from ..settings_utils import set_default_env, set_default_db, \
                              parse_email_backend_url, \
+                             parse_search_backend, parse_cache_url, \
                              parse_secure_proxy_ssl_header
 
 class SetDefaultEnvTests(TestCase):
@@ -35,6 +36,25 @@ class SetDefaultDbTests(TestCase):
             set_default_db('meh')
             self.assertEqual(os.environ['DATABASE_URL'], 'meh')
 
+class ParseSearchBackendTests(TestCase):
+    def test_accepts_postgres(self):
+        self.assertEqual(
+            parse_search_backend('postgres://u:p@localhost/hive'),
+            'directory.search_backends.PostgresSearchBackend'
+        )
+
+    def test_accepts_sqlite(self):
+        self.assertEqual(
+            parse_search_backend('sqlite:////tmp/db.sqlite3'),
+            'directory.search_backends.SqliteSearchBackend'
+        )
+
+    def test_falls_back_to_search_entries(self):
+        self.assertEqual(
+            parse_search_backend('mysql://u:p@localhost/hive'),
+            'directory.search_backends.SearchEntryBackend'
+        )
+
 class ParseEmailBackendUrlTests(TestCase):
     def test_accepts_console(self):
         self.assertEqual(parse_email_backend_url('console:'), {
@@ -76,6 +96,36 @@ class ParseEmailBackendUrlTests(TestCase):
             'EMAIL_BACKEND_INSTALLED_APPS': ()
         })
 
+class ParseCacheUrlTests(TestCase):
+    def test_accepts_locmem(self):
+        self.assertEqual(parse_cache_url('locmem:'), {'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+        }})
+
+    def test_accepts_db(self):
+        self.assertEqual(parse_cache_url('db:hive_cache'), {'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'hive_cache'
+        }})
+
+    def test_accepts_file(self):
+        self.assertEqual(parse_cache_url('file:///tmp/hive'), {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': '/tmp/hive'
+        }})
+
+    def test_accepts_memcached(self):
+        self.assertEqual(parse_cache_url('memcached://a:11211,b:11211'), {
+            'default': {
+                'BACKEND': 'django.core.cache.backends.memcached.'
+                           'MemcachedCache',
+                'LOCATION': ['a:11211', 'b:11211']
+            }
+        })
+
+    def test_rejects_unknown_schemes(self):
+        self.assertRaises(ValueError, parse_cache_url, 'lol://')
+
 class ParseSecureProxySslHeaderTests(TestCase):
     def test_basic_functionality(self):
         self.assertEqual(
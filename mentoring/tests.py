@@ -1,5 +1,11 @@
-from directory.models import Expertise
+from mock import patch
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from directory.models import Expertise, Organization, City
+from directory.management.commands.seeddata import create_user
 from directory.tests.test_views import WnycTestCase
+from . import views
 
 class MentoringTests(WnycTestCase):
     def setUp(self):
@@ -15,6 +21,33 @@ class MentoringTests(WnycTestCase):
         self.assertContains(response, '1 mentor')
         self.assertContains(response, '0 mentors')
 
+    def test_index_counts_are_computed_in_one_query(self):
+        self.login_as_wnyc_member()
+        self.client.get('/mentoring/')
+        with self.assertNumQueries(0):
+            counts = views.get_category_counts()
+        self.assertEqual([(city.shortest_name, count)
+                          for city, count in counts['other']],
+                         [('NYC', 1)])
+
+    def test_index_counts_are_updated_when_expertise_changes(self):
+        views.get_category_counts()
+        Expertise(category='other', user=self.wnyc_member).save()
+        self.assertEqual(views.get_category_counts()['other'][0][1], 2)
+
+    def test_index_lists_per_city_counts(self):
+        chicago = City(name='Chicago', slug='chicago')
+        chicago.save()
+        org = Organization(name='Chicago Org', slug='chi',
+                           website='http://example.org/', city=chicago)
+        org.save()
+        Expertise(category='other',
+                  user=create_user('chi_member', organization=org)).save()
+        self.login_as_wnyc_member()
+        response = self.client.get('/mentoring/')
+        self.assertContains(response, '2 mentors')
+        self.assertContains(response, '1 in Chicago, 1 in NYC')
+
     def test_category_page_lists_mentors_and_details(self):
         self.login_as_wnyc_member()
         response = self.client.get('/mentoring/other/')
@@ -22,5 +55,35 @@ class MentoringTests(WnycTestCase):
         self.assertContains(response, 'Brian Lehrer')
         self.assertContains(response, 'I am awesome')
 
+    def count_category_page_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/mentoring/other/')
+                             .status_code, 200)
+        return len(queries)
+
+    def test_category_page_queries_do_not_grow_with_mentors(self):
+        self.login_as_wnyc_member()
+        self.client.get('/mentoring/other/')
+        num_queries = self.count_category_page_queries()
+        for i in range(3):
+            Expertise(category='other', user=create_user(
+                'mentor%d' % i, organization=self.wnyc
+            )).save()
+        self.assertEqual(self.count_category_page_queries(), num_queries)
+
+    @patch('mentoring.views.MENTORS_PER_PAGE', 1)
+    def test_category_page_is_paginated(self):
+        Expertise(category='other', details='I am second',
+                  user=create_user('mentor', organization=self.wnyc)).save()
+        self.login_as_wnyc_member()
+        response = self.client.get('/mentoring/other/')
+        self.assertContains(response, 'I am awesome')
+        self.assertNotContains(response, 'I am second')
+        self.assertContains(response, '?page=2')
+        response = self.client.get('/mentoring/other/?page=2')
+        self.assertContains(response, 'I am second')
+        response = self.client.get('/mentoring/other/?page=9999')
+        self.assertEqual(response.status_code, 200)
+
     def test_nonmembers_are_denied(self):
         self.assertNonMembersAreDenied('/mentoring/other/')
@@ -1,24 +1,58 @@
 from django.shortcuts import render
-from django.contrib.auth.decorators import user_passes_test
+from django.core.cache import cache
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 
-from directory.models import Expertise, is_user_privileged
+from directory.auth import privileges_required
+from directory.models import Expertise
+from directory.data_version import get_version
 
-@user_passes_test(is_user_privileged)
+MENTORS_PER_PAGE = 20
+
+def get_category_counts():
+    '''
+    Returns Expertise.objects.counts_by_category_and_city(), cached
+    until directory data changes.
+    '''
+
+    key = 'mentoring_category_counts:%s' % get_version()
+    counts = cache.get(key)
+    if counts is None:
+        counts = Expertise.objects.counts_by_category_and_city()
+        cache.set(key, counts)
+    return counts
+
+@privileges_required
 def category_mentors(request, category):
-    skills = Expertise.objects.of_vouched_users().filter(category=category)
+    all_skills = Expertise.objects.of_vouched_users().filter(
+        category=category
+    ).select_related(
+        'user__membership__organization__city'
+    ).order_by('created', 'id')
+    paginator = Paginator(all_skills, MENTORS_PER_PAGE)
+
+    page = request.GET.get('page')
+    try:
+        skills = paginator.page(page)
+    except PageNotAnInteger:
+        skills = paginator.page(1)
+    except EmptyPage:
+        skills = paginator.page(paginator.num_pages)
+
     return render(request, 'mentoring/category_mentors.html', {
         'category': dict(Expertise.CATEGORY_CHOICES)[category],
         'skills': skills
     })
 
 def index(request):
+    counts = get_category_counts()
     categories = []
     for slug, name in Expertise.CATEGORY_CHOICES:
-        skills = Expertise.objects.of_vouched_users().filter(category=slug)
+        cities = counts.get(slug, [])
         categories.append({
             'slug': slug,
             'name': name,
-            'count': len(skills)
+            'count': sum(count for city, count in cities),
+            'cities': cities
         })
 
     return render(request, 'mentoring/index.html', {